@@ -9,23 +9,28 @@ cd /home/idmind/elmo-v2/src
 /usr/bin/python middleware.py reset
 /usr/bin/python load_config.py
 
-/usr/bin/python driver_battery.py &
-/usr/bin/python driver_gpio.py &
+# driver_leds needs root to access the neopixel pins, keep it in its own process
 sudo /usr/bin/python driver_leds.py &
-/usr/bin/python driver_pan_tilt.py &
-/usr/bin/python driver_power.py &
-/usr/bin/python driver_speakers.py &
-/usr/bin/python driver_touch_sensors.py &
-/usr/bin/python driver_microphone.py &
-/usr/bin/python driver_speech.py &
 
 /usr/bin/python http_server.py &
 /usr/bin/python robot_api.py &
-/usr/bin/python touch_calibrator.py &
 /usr/bin/python mjpeg_server_2.py &
 
-/usr/bin/python behaviour_blush.py &
+# drivers and behaviours share a single interpreter
+/usr/bin/python -m nodehost \
+    driver_battery \
+    driver_gpio \
+    driver_pan_tilt \
+    driver_power \
+    driver_speakers \
+    driver_touch_sensors \
+    driver_microphone \
+    driver_speech \
+    touch_calibrator \
+    behaviour_blush \
+    behaviour_change_mode &
+
+# behaviour_look_around owns the video capture, keep it in its own process
 /usr/bin/python behaviour_look_around.py &
-/usr/bin/python behaviour_change_mode.py &
 
 /usr/bin/python driver_camera.py
@@ -9,7 +9,6 @@ When the power button is pressed, the behaviour changes the leds.
 
 """
 
-import time
 
 import middleware as mw
 
@@ -92,7 +91,12 @@ class ModeManager:
             self.node.loginfo("starting behaviour")
             was_pressed = False
             self.next_mode()
+            changes = self.node.changes(
+                self.behaviours.key("change_mode"),
+                self.gpio.key("button_pressed"),
+            )
             while not self.node.is_shutdown():
+                changes.wait(1.0)
                 if not self.behaviours.change_mode:
                     continue
                 is_pressed = self.gpio.button_pressed
@@ -65,8 +65,13 @@ class DriverGpio:
         """
         try:
             self.gpio.ready = True
+            changes = self.node.changes(
+                self.gpio.key("audio_enable"),
+                self.gpio.key("monitor_enable"),
+            )
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                # the pins are still polled, but power commands apply immediately
+                changes.wait(0.1)
                 if self.gpio.audio_enable and not self.gpio.audio_enabled:
                     self.enable_audio(True)
                     self.gpio.audio_enabled = True
@@ -79,16 +84,17 @@ class DriverGpio:
                 elif not self.gpio.monitor_enable and self.gpio.monitor_enabled:
                     self.enable_monitor(False)
                     self.gpio.monitor_enabled = False
-                if GPIO.input(self.gpio.button_pin):
-                    self.gpio.button_pressed = True
-                    self.node.loginfo("gpio: button pressed")
-                else:
-                    self.gpio.button_pressed = False
-                if GPIO.input(self.gpio.shutdown_pin):
-                    self.gpio.robot_shutdown = True
-                    self.node.loginfo("gpio: shutdown")
-                else:
-                    self.gpio.robot_shutdown = False
+                # pin states are only written when they change, each write wakes the nodes that watch them
+                button_pressed = bool(GPIO.input(self.gpio.button_pin))
+                if button_pressed != self.gpio.button_pressed:
+                    self.gpio.button_pressed = button_pressed
+                    if button_pressed:
+                        self.node.loginfo("gpio: button pressed")
+                robot_shutdown = bool(GPIO.input(self.gpio.shutdown_pin))
+                if robot_shutdown != self.gpio.robot_shutdown:
+                    self.gpio.robot_shutdown = robot_shutdown
+                    if robot_shutdown:
+                        self.node.loginfo("gpio: shutdown")
         except KeyboardInterrupt:
             pass
         finally:
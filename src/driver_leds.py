@@ -9,17 +9,109 @@ This node manages the neopixel matrix.
 
 Uses the neopixel library to control the leds.
 
+Set the animation field of leds to play an animated icon, the driver decodes it once and plays the frames from memory.
+Frames are timed on a monotonic clock from the start of the animation, so late frames are skipped instead of delaying the rest.
+A new animation replaces the current one, unless it is queued. Setting colors cancels all animations.
+
+Set the effect field of leds to render a procedural effect, see led_effects.py. The driver renders it at EFFECT_RATE.
+Setting an effect of the same type updates its parameters without restarting it, e.g. the level of the meter.
+Setting colors or an animation stops the effect, setting an effect stops the animations.
+
+Frames are numpy uint8 arrays, clamped in one operation. Only the leds that changed are written to the pixel buffer,
+which is updated in bulk, and the leds are not refreshed when nothing changed.
+
+Brightness, gamma and color balance are applied through a lookup table from color components to led values.
+The table is computed once per setting, and the leds are redrawn when the settings change, without a restart.
+
 """
 
 
+import collections
+import functools
 import time
 import board
 import neopixel
 
+import numpy as np
 
+import icons
+import led_effects
 import middleware as mw
 
 
+# frame duration of icons that do not define one, in seconds
+DEFAULT_FRAME_DURATION = 0.1
+# how often effects are rendered, in hz
+EFFECT_RATE = 50.0
+# order of the color components in the pixel buffer, the leds are GRB
+PIXEL_ORDER = [1, 0, 2]
+# component of each column of a frame, to index the color table
+CHANNELS = np.arange(3)
+# fields that change the color table
+OUTPUT_FIELDS = ("brightness", "gamma", "color_balance")
+
+
+@functools.lru_cache(maxsize=16)
+def color_table(brightness, gamma, color_balance):
+    """
+    Get the table from color components to led values, with shape (3, 256), a row per component.
+    Raises ValueError if gamma is not positive, or color_balance does not have 3 factors.
+    """
+    if not gamma > 0 or len(color_balance) != 3:
+        raise ValueError(f'invalid gamma {gamma} or color balance {color_balance}')
+    values = (np.arange(256) / 255.0) ** gamma * 255.0
+    factors = np.clip(np.asarray(color_balance, dtype=float), 0, 1) * min(1.0, max(0.0, brightness))
+    # small offset, so a linear table matches int(value * brightness)
+    table = np.floor(values * factors[:, None] + 1e-6).astype(np.uint8)
+    table.flags.writeable = False
+    return table
+
+
+class Animation:
+    """
+    Animation class.
+    Plays the frames of an icon, once, a number of times, or forever.
+    """
+
+    def __init__(self, name, icon, loop=False, fps=None):
+        self.name = name
+        self.frames = icon.frames
+        if fps is not None:
+            if not fps > 0:
+                raise ValueError(f'fps must be greater than 0, got {fps}')
+            durations = np.full(len(self.frames), 1.0 / fps)
+        else:
+            durations = np.array([d if d > 0 else DEFAULT_FRAME_DURATION for d in icon.durations])
+        # end time of each frame, from the start of a cycle
+        self.ends = np.cumsum(durations)
+        if loop is True:
+            self.cycles = None
+        else:
+            self.cycles = max(1, int(loop))
+        self.start = None
+
+    def duration(self):
+        """
+        Get the duration of the animation, in seconds, None if it loops forever.
+        """
+        if self.cycles is None:
+            return None
+        return self.cycles * self.ends[-1]
+
+    def frame_at(self, now):
+        """
+        Get the index of the frame to show at a monotonic time, and the time of the next frame.
+        Returns None, None when the animation is over.
+        """
+        t = now - self.start
+        duration = self.duration()
+        if duration is not None and t >= duration:
+            return None, None
+        cycle, t = divmod(t, self.ends[-1])
+        index = min(int(np.searchsorted(self.ends, t, side="right")), len(self.frames) - 1)
+        return index, self.start + cycle * self.ends[-1] + self.ends[index]
+
+
 class DriverLeds:
 
     def __init__(self):
@@ -30,34 +122,241 @@ class DriverLeds:
         """
         self.node = mw.Node("driver_leds")
         self.leds = mw.Leds()
-        self.colors = [[0, 0, 0]] * self.leds.number
-        self.pixels = neopixel.NeoPixel(board.D18, self.leds.number, brightness=self.leds.brightness, auto_write=False)
+        self.server = mw.Server()
+        self.table = color_table(1.0, 1.0, (1.0, 1.0, 1.0))
+        # brightness is applied to the frames by the color table, before they are written to the pixel buffer
+        self.pixels = neopixel.NeoPixel(board.D18, self.leds.number, brightness=1.0, auto_write=False, pixel_order=neopixel.GRB)
+        self.buffer = self.pixel_buffer()
+        if self.buffer is None:
+            self.node.logwarn("neopixel buffer is not writable, leds are set one by one")
+        self.shown = None
+        self.animation = None
+        self.queue = collections.deque()
+        self.frame = None
+        self.effect = None
+        self.effect_type = None
+        self.effect_start = None
+        # animations are decoded by this node, so only its cache is prewarmed
+        self.node.loginfo(f'decoded {len(self.leds.prewarm_icons())} icons')
         print("brightness: %s, %s" % (self.leds.brightness, type(self.leds.brightness)))
-    
+
+    def pixel_buffer(self):
+        """
+        Get a writable numpy view of the neopixel buffer, with a row per led.
+        Returns None if the buffer is not writable, pixels are then set one by one.
+        """
+        try:
+            buf = self.pixels.buf
+            buffer = np.frombuffer(buf, dtype=np.uint8)
+        except (AttributeError, TypeError):
+            return None
+        # older neopixel versions return a copy of the buffer
+        if buf is not self.pixels.buf or not buffer.flags.writeable or buffer.size != self.leds.number * 3:
+            return None
+        return buffer.reshape(-1, 3)
+
+    def update_output(self):
+        """
+        Get the color table of the brightness, gamma and color balance, and redraw the leds with it.
+        """
+        settings = self.leds.snapshot(*OUTPUT_FIELDS)
+        try:
+            table = color_table(float(settings["brightness"]), float(settings["gamma"]),
+                                tuple(float(c) for c in settings["color_balance"][:3]))
+        except (TypeError, ValueError):
+            self.node.logwarn(f'invalid led settings: {settings}')
+            return
+        if table is self.table:
+            return
+        self.table = table
+        self.node.loginfo(f'brightness {settings["brightness"]}, gamma {settings["gamma"]}, color balance {settings["color_balance"]}')
+        if self.shown is not None:
+            shown = self.shown
+            self.shown = None
+            self.show(shown)
+
+    def show(self, colors):
+        """
+        Write colors to the leds, only the leds that changed are written.
+        """
+        frame = np.asarray(colors)
+        if frame.shape != (self.leds.number, 3):
+            self.node.logwarn(f'invalid colors, shape {frame.shape}')
+            return
+        if frame.dtype != np.uint8:
+            frame = np.clip(frame, 0, 255).astype(np.uint8)
+        if self.shown is None:
+            changed = np.ones(self.leds.number, dtype=bool)
+        else:
+            changed = np.any(frame != self.shown, axis=1)
+            if not changed.any():
+                return
+        self.shown = frame.copy()
+        output = self.table[CHANNELS, frame[changed]]
+        if self.buffer is not None:
+            self.buffer[changed] = output[:, PIXEL_ORDER]
+        else:
+            for i, color in zip(np.flatnonzero(changed), output.tolist()):
+                self.pixels[i] = color
+        self.pixels.show()
+
+    def load_animation(self, command):
+        """
+        Get the Animation of a command, None if it can not be played.
+        """
+        name = command.get("name")
+        url = command.get("url")
+        try:
+            icon = self.leds.load_icon(self.server.url_for_icon(name) if name is not None else url)
+            return Animation(name if name is not None else url, icon, command.get("loop", False), command.get("fps"))
+        except Exception as e:
+            self.node.logwarn(f'can not play animation {command}: {e}')
+            return None
+
+    def handle_animation(self, command):
+        """
+        Start, queue or cancel animations.
+        """
+        if not isinstance(command, dict):
+            self.node.logwarn(f'invalid animation: {command}')
+            return
+        if command.get("name") is None and command.get("url") is None:
+            self.stop_animations()
+            return
+        animation = self.load_animation(command)
+        if animation is None:
+            return
+        self.stop_effect()
+        if command.get("queue") and self.animation is not None:
+            self.queue.append(animation)
+        else:
+            self.queue.clear()
+            self.start_animation(animation, time.monotonic())
+
+    def start_animation(self, animation, now):
+        animation.start = now
+        self.animation = animation
+        self.frame = None
+        self.leds.playing = animation.name
+
+    def stop_animations(self):
+        """
+        Cancel the current and queued animations, the leds keep the last frame.
+        """
+        self.queue.clear()
+        if self.animation is not None:
+            self.animation = None
+            self.leds.playing = None
+
+    def handle_effect(self, params):
+        """
+        Start, update or stop the effect.
+        """
+        if params is None:
+            self.stop_effect()
+            return
+        if not isinstance(params, dict):
+            self.node.logwarn(f'invalid effect: {params}')
+            return
+        if self.effect is not None and params.get("type") == self.effect_type:
+            try:
+                self.effect.update(params)
+            except (ValueError, TypeError) as e:
+                self.node.logwarn(f'can not update effect {params}: {e}')
+            return
+        try:
+            effect = led_effects.create(params)
+        except (ValueError, TypeError) as e:
+            self.node.logwarn(f'can not start effect {params}: {e}')
+            return
+        self.stop_animations()
+        self.effect = effect
+        self.effect_type = params["type"]
+        self.effect_start = time.monotonic()
+        self.leds.playing = self.effect_type
+
+    def stop_effect(self):
+        """
+        Stop the effect, the leds keep the last frame.
+        """
+        if self.effect is not None:
+            self.effect = None
+            self.leds.playing = None
+
+    def render(self, now):
+        """
+        Show the current frame of the effect.
+        Returns the time of the next frame, None if no effect is running.
+        """
+        if self.effect is None:
+            return None
+        try:
+            image = self.effect.render(now - self.effect_start)
+            self.show(icons.to_leds(np.clip(image, 0, 255).astype(np.uint8)))
+        except (ValueError, TypeError, ArithmeticError) as e:
+            self.node.logwarn(f'effect {self.effect_type} failed: {e}')
+            self.stop_effect()
+            return None
+        return now + 1.0 / EFFECT_RATE
+
+    def play(self, now):
+        """
+        Show the current frame of the animations, or of the effect.
+        Returns the time of the next frame, None if nothing is playing.
+        """
+        while self.animation is not None:
+            index, next_frame = self.animation.frame_at(now)
+            if index is not None:
+                if index != self.frame:
+                    self.show(self.animation.frames[index])
+                    self.frame = index
+                return next_frame
+            if len(self.queue) > 0:
+                self.start_animation(self.queue.popleft(), now)
+            else:
+                # clear the leds at the end, like the last frame of the icon
+                self.stop_animations()
+                self.show(np.zeros((self.leds.number, 3), dtype=np.uint8))
+        return self.render(now)
+
     def run(self):
         """
         Main loop.
+        Sleeps until the colors or animation fields change, or until the next animation frame.
         """
         try:
+            self.leds.animation = None
+            self.leds.effect = None
+            self.leds.playing = None
+            # reading stores the defaults of missing fields, before they are watched, so storing them does not cancel a command
+            self.leds.snapshot()
+            output_keys = {self.leds.key(f) for f in OUTPUT_FIELDS}
+            changes = self.node.changes(*[self.leds.key(f) for f in ("colors", "animation", "effect") + OUTPUT_FIELDS])
+            next_frame = None
+            # ready last, so commands sent once the driver is ready are not reset
             self.leds.ready = True
             while not self.node.is_shutdown():
-                time.sleep(0.1)
-                colors = self.leds.colors[:]
-                if colors != self.colors:
-                    # print("writing")
-                    for i in range(self.leds.number):
-                        r = max(0, min(255, int(colors[i][0])))
-                        g = max(0, min(255, int(colors[i][1])))
-                        b = max(0, min(255, int(colors[i][2])))
-                        self.pixels[i] = [r, g, b]
-                    self.pixels.show()
-                    self.colors = colors
+                timeout = 1.0 if next_frame is None else max(0.0, next_frame - time.monotonic())
+                changes.wait(timeout)
+                changed = changes.pop()
+                if changed & output_keys:
+                    self.update_output()
+                if self.leds.key("colors") in changed:
+                    self.stop_animations()
+                    self.stop_effect()
+                    self.show(self.leds.colors)
+                if self.leds.key("effect") in changed:
+                    self.handle_effect(self.leds.effect)
+                # taking a command writes the field, only take it when it is set
+                command = self.leds.take("animation") if self.leds.animation is not None else None
+                if command is not None:
+                    self.handle_animation(command)
+                next_frame = self.play(time.monotonic())
         except KeyboardInterrupt:
             pass
         finally:
-            for i in range(self.leds.number):
-                self.pixels[i] = [0, 0, 0]
-            self.pixels.show()
+            self.show(np.zeros((self.leds.number, 3), dtype=np.uint8))
+            self.leds.playing = None
             self.node.shutdown()
 
 
@@ -13,7 +13,6 @@ Stores captured audio to wave file called mic.wav, in the multimedia server's st
 
 
 import os
-import time
 
 import middleware as mw
 
@@ -45,8 +44,9 @@ class DriverMicrophone:
         """
         try:
             self.microphone.ready = True
+            changes = self.node.changes(self.microphone.key("record"))
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                changes.wait(1.0)
                 if self.microphone.record and not self.microphone.is_recording:
                     self.start_recording_audio()
                 elif not self.microphone.record and self.microphone.is_recording:
@@ -9,25 +9,86 @@ This node manages the pan tilt servos.
 
 Uses the herkulex library to control the servos.
 
+Commands are sent as soon as the pan or tilt fields change, while a separate thread reads the servo telemetry.
+Both go through the herkulex bus scheduler, which sends motion commands before queued reads.
+
+Set the trajectory field of pan or tilt to stream a smooth move, the driver sends interpolated setpoints at STREAM_RATE.
+A new trajectory starts from the current setpoint, so it blends with the move in progress. Setting angle cancels it.
+Trajectories are timed on a monotonic clock, so clock adjustments after boot do not affect them.
+
+The telemetry is added to the servo telemetry stream of the middleware, which keeps its history.
+
+Pass a serial port to use it instead of /dev/ttyS0, e.g. the pty of herkulex_sim.py.
+
 """
 
 
+import sys
+import threading
 import time
 
 import herkulex as hx
 import middleware as mw
 
 
+# serial port of the servos
+SERIAL_PORT = "/dev/ttyS0"
+# how often the servo telemetry is read, in seconds
+TELEMETRY_PERIOD = 0.1
+# fields that trigger commands to the servos
+COMMAND_FIELDS = ("angle", "enable", "pid_p", "pid_d", "trajectory")
+# how often trajectory setpoints are sent, in hz
+STREAM_RATE = 50.0
+# playtime of each trajectory setpoint, a little over the stream period so the servos do not stop in between
+STREAM_PLAYTIME = int(1.0 / STREAM_RATE / hx.PLAYTIME_UNIT) + 1
+
+
+class Trajectory:
+    """
+    Trajectory class.
+    A list of (t, angle) waypoints, t in seconds from the start, interpolated linearly.
+    """
+
+    def __init__(self, waypoints, origin):
+        """
+        Sort the waypoints, and start from origin if the first waypoint is not at t = 0.
+        """
+        self.waypoints = sorted((float(t), float(angle)) for t, angle in waypoints)
+        if self.waypoints[0][0] > 0:
+            self.waypoints.insert(0, (0.0, origin))
+        self.start = time.monotonic()
+        self.setpoint = self.waypoints[0][1]
+
+    def duration(self):
+        return self.waypoints[-1][0]
+
+    def angle_at(self, t):
+        """
+        Get the angle at t seconds from the start.
+        """
+        if t >= self.duration():
+            return self.waypoints[-1][1]
+        for (t0, a0), (t1, a1) in zip(self.waypoints, self.waypoints[1:]):
+            if t < t1:
+                return a0 + (a1 - a0) * (t - t0) / (t1 - t0) if t1 > t0 else a1
+        return self.waypoints[-1][1]
+
+
 class DriverPanTilt:
 
-    def __init__(self):
+    def __init__(self, port=SERIAL_PORT):
         """
-        Connect to middleware.
+        Connect to middleware, caching reads of the pan and tilt fields.
         Initialize node.
         """
-        self.pan = mw.Pan()
-        self.tilt = mw.Tilt()
+        self.port = port
+        self.pan = mw.Pan(cache=True)
+        self.tilt = mw.Tilt(cache=True)
         self.node = mw.Node("driver_pan_tilt")
+        self.bus = None
+        self.trajectories = {}
+        self.next_setpoint = 0.0
+        self.telemetry_stream = mw.ServoTelemetry()
     
     def connect(self):
         """
@@ -35,69 +96,171 @@ class DriverPanTilt:
         """
         pan_id = self.pan.id
         tilt_id = self.tilt.id
-        hx.connect("/dev/ttyS0", 115200)
+        self.bus = hx.HerkulexBus(self.port, 115200)
         self.node.loginfo("connected to serial port")
-        hx.clear_errors()
+        self.bus.clear_errors()
         time.sleep(1.0)
         self.node.loginfo("errors cleared")
         self.node.loginfo("connecting to pan servo using id %s" % pan_id)
-        self.servo_pan = hx.servo(pan_id)
+        self.servo_pan = hx.servo(pan_id, self.bus)
         self.node.loginfo("connected to pan servo")
         self.node.loginfo("connecting to tilt servo using id %s" % tilt_id)
-        self.servo_tilt = hx.servo(tilt_id)
+        self.servo_tilt = hx.servo(tilt_id, self.bus)
         self.node.loginfo("connected to tilt servo")
         time.sleep(1.0)
         self.node.loginfo("connected to pan tilt servos")
 
+    def start_trajectory(self, entry):
+        """
+        Start streaming the trajectory of an axis, from its current setpoint.
+        """
+        waypoints = entry.take("trajectory")
+        if waypoints is None:
+            return
+        if not entry.enabled:
+            self.node.logwarn(f'{entry.prefix} torque is disabled, ignoring trajectory: {waypoints}')
+            return
+        previous = self.trajectories.get(entry.prefix)
+        origin = previous.setpoint if previous is not None else entry.current_angle
+        try:
+            self.trajectories[entry.prefix] = Trajectory(waypoints, origin)
+        except (TypeError, ValueError, IndexError):
+            self.node.logwarn(f'invalid {entry.prefix} trajectory: {waypoints}')
+
+    def stream_trajectories(self):
+        """
+        Send the next setpoint of the trajectories, both axes move together.
+        """
+        now = time.monotonic()
+        if not self.trajectories or now < self.next_setpoint:
+            return
+        self.next_setpoint = max(self.next_setpoint + 1.0 / STREAM_RATE, now)
+        moves = []
+        for entry, servo in ((self.pan, self.servo_pan), (self.tilt, self.servo_tilt)):
+            trajectory = self.trajectories.get(entry.prefix)
+            if trajectory is None:
+                continue
+            t = now - trajectory.start
+            trajectory.setpoint = trajectory.angle_at(t)
+            angle = max(entry.min_angle, min(entry.max_angle, trajectory.setpoint))
+            moves.append((servo.servoid, servo.angle_to_position(angle + entry.angle_bias), 0))
+            if t >= trajectory.duration():
+                # finish at the last waypoint, without a move from the angle field
+                del self.trajectories[entry.prefix]
+                with mw.batch():
+                    entry.angle = trajectory.setpoint
+                    entry.angle_ref = trajectory.setpoint
+        self.bus.sync_move(moves, STREAM_PLAYTIME)
+
+    def telemetry_sample(self, entry, servo, telemetry, now):
+        """
+        Get the history sample of a servo's telemetry, with the angle corrected by the angle bias like current_angle.
+        """
+        return {
+            "time": now,
+            "servo": servo.servoid,
+            "position": telemetry.position,
+            "goal": telemetry.goal_position,
+            "angle": telemetry.angle - entry.angle_bias,
+            "torque": telemetry.torque,
+            "temperature": telemetry.temperature,
+            "voltage": telemetry.voltage,
+            "status_error": int(telemetry.status_error),
+            "status_detail": int(telemetry.status_detail),
+        }
+
+    def publish_telemetry(self, entry, telemetry):
+        """
+        Publish the telemetry of a servo.
+        """
+        entry.current_angle = telemetry.angle - entry.angle_bias
+        entry.temperature = telemetry.temperature
+        entry.voltage = telemetry.voltage
+        entry.torque = telemetry.torque
+        entry.status_error = telemetry.status_error
+        entry.status_detail = telemetry.status_detail
+
+    def run_telemetry(self):
+        """
+        Telemetry loop, reads and publishes the servo telemetry.
+        It does not tick the heartbeat, so a stuck main loop is reported as stalled.
+        Unexpected errors shut the node down, instead of leaving it running without telemetry.
+        """
+        while not self.node.is_shutdown(tick=False):
+            start = time.time()
+            started = time.monotonic()
+            try:
+                pan = self.servo_pan.read_telemetry()
+                tilt = self.servo_tilt.read_telemetry()
+                with mw.batch():
+                    self.publish_telemetry(self.pan, pan)
+                    self.publish_telemetry(self.tilt, tilt)
+                self.telemetry_stream.add([
+                    self.telemetry_sample(self.pan, self.servo_pan, pan, start),
+                    self.telemetry_sample(self.tilt, self.servo_tilt, tilt, start),
+                ])
+            except hx.HerkulexError as e:
+                self.node.logwarn(f'telemetry error: {e}')
+            except Exception as e:
+                self.node.logerror(f'telemetry failed, shutting down: {e!r}')
+                self.node.shutdown_event.set()
+                return
+            self.node.wait_shutdown(max(0.0, TELEMETRY_PERIOD - (time.monotonic() - started)), tick=False)
+
     def run(self):
         """
         Main loop.
         """
+        telemetry = None
         try:
             self.error_count = 0
             self.connected = False
             self.connect()
+            self.bus.start_scheduler()
             self.pan.ready = True
             self.tilt.ready = True
+            telemetry = threading.Thread(target=self.run_telemetry, name="telemetry", daemon=True)
+            telemetry.start()
+            changes = self.node.changes(*[e.key(f) for e in (self.pan, self.tilt) for f in COMMAND_FIELDS])
             while not self.node.is_shutdown():
+                if self.trajectories:
+                    changes.wait(max(0.0, self.next_setpoint - time.monotonic()))
+                else:
+                    changes.wait(1.0)
                 try:
                     # calibrate pid
                     if self.pan.pid_p != self.pan.pid_current_p:
                         self.servo_pan.set_position_p(self.pan.pid_p)
-                        time.sleep(0.2)
                         self.pan.pid_current_p = self.pan.pid_p
                     if self.pan.pid_d != self.pan.pid_current_d:
                         self.servo_pan.set_position_d(self.pan.pid_d)
-                        time.sleep(0.2)
                         self.pan.pid_current_d = self.pan.pid_d
                     if self.tilt.pid_p != self.tilt.pid_current_p:
                         self.servo_tilt.set_position_p(self.tilt.pid_p)
-                        time.sleep(0.2)
                         self.tilt.pid_current_p = self.tilt.pid_p
                     if self.tilt.pid_d != self.tilt.pid_current_d:
                         self.servo_tilt.set_position_d(self.tilt.pid_d)
-                        time.sleep(0.2)
                         self.tilt.pid_current_d = self.tilt.pid_d
                     # torque
                     if self.pan.enable and not self.pan.enabled:
                         self.servo_pan.torque_on()
-                        time.sleep(0.2)
                         self.pan.enabled = True
                     elif not self.pan.enable and self.pan.enabled:
                         self.servo_pan.torque_off()
-                        time.sleep(0.2)
                         self.pan.enabled = False
                     if self.tilt.enable and not self.tilt.enabled:
                         self.servo_tilt.torque_on()
-                        time.sleep(0.2)
                         self.tilt.enabled = True
                     elif not self.tilt.enable and self.tilt.enabled:
                         self.servo_tilt.torque_off()
-                        time.sleep(0.2)
                         self.tilt.enabled = False
+                    # set angles, both axes move together
+                    moves = []
+                    playtimes = []
                     # set pan angle
                     if self.pan.enabled and self.pan.angle_ref != self.pan.angle:
                         self.pan.angle_ref = self.pan.angle
+                        self.trajectories.pop(self.pan.prefix, None)
                         angle = max(self.pan.min_angle, min(self.pan.max_angle, self.pan.angle))
                         # calculate playtime based on motion range.
                         motion_range = abs(self.pan.current_angle - angle)
@@ -106,12 +269,12 @@ class DriverPanTilt:
                         playtime = int(self.pan.min_playtime + (self.pan.max_playtime - self.pan.min_playtime) * motion_range_percent)
                         # self.node.loginfo("setting pan angle to %s with playtime %s" % (angle, playtime))
                         angle += self.pan.angle_bias
-                        self.servo_pan.set_servo_angle(angle, playtime, 0)
-                        time.sleep(0.2)
-                        # self.node.loginfo("pan angle set")
+                        moves.append((self.servo_pan.servoid, self.servo_pan.angle_to_position(angle), 0))
+                        playtimes.append(playtime)
                     # set tilt angle
                     if self.tilt.enabled and self.tilt.angle_ref != self.tilt.angle:
                         self.tilt.angle_ref = self.tilt.angle
+                        self.trajectories.pop(self.tilt.prefix, None)
                         angle = max(self.tilt.min_angle, min(self.tilt.max_angle, self.tilt.angle))
                         # calculate playtime based on motion range.
                         motion_range = abs(self.tilt.current_angle - angle)
@@ -120,30 +283,33 @@ class DriverPanTilt:
                         playtime = int(self.tilt.min_playtime + (self.tilt.max_playtime - self.tilt.min_playtime) * motion_range_percent)
                         # self.node.loginfo("setting tilt angle to %s with playtime %s" % (angle, playtime))
                         angle += self.tilt.angle_bias
-                        self.servo_tilt.set_servo_angle(angle, playtime, 0)
-                        time.sleep(0.2)
-                        # self.node.loginfo("tilt angle set")
-                    # update current angles
-                    self.pan.current_angle = self.servo_pan.get_servo_angle() - self.pan.angle_bias
-                    time.sleep(0.2)
-                    self.tilt.current_angle = self.servo_tilt.get_servo_angle() - self.tilt.angle_bias
-                    time.sleep(0.2)
-                    # update current temperature
-                    self.pan.temperature = self.servo_pan.get_servo_temperature()
-                    time.sleep(0.2)
-                    self.tilt.temperature = self.servo_tilt.get_servo_temperature()
-                    time.sleep(0.2)
-                except IndexError:
-                    hx.clear_errors()
-                    time.sleep(0.1)
+                        moves.append((self.servo_tilt.servoid, self.servo_tilt.angle_to_position(angle), 0))
+                        playtimes.append(playtime)
+                    if moves:
+                        self.bus.sync_move(moves, max(playtimes))
+                    # stream trajectories
+                    if self.pan.trajectory:
+                        self.start_trajectory(self.pan)
+                    if self.tilt.trajectory:
+                        self.start_trajectory(self.tilt)
+                    self.stream_trajectories()
+                except hx.HerkulexError as e:
+                    self.node.logwarn(f'command error: {e}')
+                    self.bus.clear_errors()
+            changes.close()
         except hx.HerkulexError as e:
             print(f'herkulex error: {e}')
         finally:
+            # stop the telemetry thread before the port is closed
+            self.node.shutdown_event.set()
+            if telemetry is not None:
+                telemetry.join()
             time.sleep(1.0)
             self.node.shutdown()
-            hx.close()
+            if self.bus is not None:
+                self.bus.close()
 
 
 if __name__ == '__main__':
-    node = DriverPanTilt()
+    node = DriverPanTilt(*sys.argv[1:2])
     node.run()
@@ -15,7 +15,6 @@ Also reacts to the GPIO shutdown event and battery at 0%.
 
 
 import os
-import time
 
 import middleware as mw
 
@@ -45,8 +44,16 @@ class DriverPower:
         Main loop.
         """
         try:
+            changes = self.node.changes(
+                self.power.key("reboot"),
+                self.power.key("shutdown"),
+                self.power.key("gpio_shutdown"),
+                self.power.key("battery_shutdown"),
+                self.gpio.key("robot_shutdown"),
+                self.battery.key("percentage"),
+            )
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                changes.wait(1.0)
                 # reboot flag of the middleware.Power class
                 if self.power.reboot:
                     self.reboot()
@@ -7,16 +7,22 @@ Driver node.
 
 This node manages the speakers.
 
-Uses the aplay command to play sounds.
+Uses the aplay command to play sounds, streamed with curl.
 
 """
 
 import os
-import multiprocessing
-import time
+import shlex
+import signal
+import subprocess
 import middleware as mw
 
 
+# how often to check if the sound finished, while playing, in seconds
+FINISH_CHECK_PERIOD = 0.1
+# how long to wait for the playback to stop, before killing it, in seconds
+STOP_TIMEOUT = 1.0
+
 
 class DriverSpeakers:
 
@@ -32,20 +38,29 @@ class DriverSpeakers:
 
     def play_sound(self, url):
         """
-        Play a sound.
+        Start playing a sound, with curl piped to aplay in a new process group.
+        The node can be hosted with other nodes, so the pipeline is started with exec instead of forking the node.
         """
-        self.speakers.playing = url
         print(f'playing {url}')
-        os.system(f'/usr/bin/curl {url} | /usr/bin/aplay')
-        self.speakers.url = None
-        self.speakers.playing = None
+        self.process = subprocess.Popen(f'/usr/bin/curl {shlex.quote(url)} | /usr/bin/aplay', shell=True, start_new_session=True)
+        self.speakers.playing = url
     
     def stop_sound(self):
         """
-        Stop playing a sound, by killing the aplay process.
+        Stop playing a sound, by terminating the playback process group.
         """
+        if self.process is None:
+            return
         print(f'stopping')
-        os.system("/usr/bin/killall aplay")
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            self.process.wait(STOP_TIMEOUT)
+        except ProcessLookupError:
+            pass
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        self.process = None
 
     def run(self):
         """
@@ -53,20 +68,31 @@ class DriverSpeakers:
         """
         try:
             self.speakers.ready = True
+            changes = self.node.changes(
+                self.speakers.key("url"),
+                self.speakers.key("playing"),
+                self.speakers.key("volume"),
+            )
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                changes.wait(1.0 if self.process is None else FINISH_CHECK_PERIOD)
                 url = self.speakers.url
                 playing = self.speakers.playing
                 volume = self.speakers.volume
-                # play sound
+                # sound finished, clear it unless another one was requested
+                if self.process is not None and self.process.poll() is not None:
+                    self.process = None
+                    if url == playing:
+                        with self.speakers.batch():
+                            self.speakers.url = None
+                            self.speakers.playing = None
+                        url = playing = None
+                # play or stop sound
                 if url != playing:
                     self.stop_sound()
-                    self.process = multiprocessing.Process(target=self.play_sound, args=(url,))
-                    self.process.start()
-                # stop sound
-                if playing and url is None:
-                    self.stop_sound()
-                    self.speakers.playing = None
+                    if url is not None:
+                        self.play_sound(url)
+                    else:
+                        self.speakers.playing = None
                 # change volume
                 if self.volume != volume:
                     if 0 == os.system(f'/usr/bin/amixer sset "Master" {volume}%'):
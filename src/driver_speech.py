@@ -17,7 +17,6 @@ Internet connection is required.
 
 
 import os
-import time
 
 import middleware as mw
 
@@ -46,8 +45,9 @@ class DriverSpeech:
         """
         try:
             self.speech.ready = True
+            changes = self.node.changes(self.speech.key("say"))
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                changes.wait(1.0)
                 if self.speech.saying != self.speech.say:
                     self.speech.saying = self.speech.say
                     self.speak(self.speech.language, self.speech.say)
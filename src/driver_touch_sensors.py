@@ -38,11 +38,12 @@ class DriverTouchSensors:
         try:
             self.touch_sensors.ready = True
             while not self.node.is_shutdown():
-                self.touch_sensors.chest_raw = self.mpr121.filtered_data(0)
-                self.touch_sensors.head_0_raw = self.mpr121.filtered_data(1)
-                self.touch_sensors.head_1_raw = self.mpr121.filtered_data(2)
-                self.touch_sensors.head_2_raw = self.mpr121.filtered_data(3)
-                self.touch_sensors.head_3_raw = self.mpr121.filtered_data(4)    
+                with self.touch_sensors.batch():
+                    self.touch_sensors.chest_raw = self.mpr121.filtered_data(0)
+                    self.touch_sensors.head_0_raw = self.mpr121.filtered_data(1)
+                    self.touch_sensors.head_1_raw = self.mpr121.filtered_data(2)
+                    self.touch_sensors.head_2_raw = self.mpr121.filtered_data(3)
+                    self.touch_sensors.head_3_raw = self.mpr121.filtered_data(4)
                 time.sleep(0.1)
         finally:
             self.node.shutdown()
@@ -20,6 +20,10 @@ India Pvt. Ltd. (mailto:contact@sastrarobotics.com)
 
 
 """ 
+import collections
+import enum
+import itertools
+import threading
 import time
 try:
     # PySerial Module
@@ -32,6 +36,9 @@ import sys
 __PYTHON_3__ = sys.version_info.major == 3
 if __PYTHON_3__:
     ord = lambda x: x
+    import queue
+else:
+    import Queue as queue
 
 # Commands
 EEP_WRITE_REQ = 0x01
@@ -150,40 +157,56 @@ DESIRED_VELOCITY_RAM = 72
 BYTE1 = 0x01
 BYTE2 = 0x02
 
+# telemetry block, from VOLTAGE_RAM to ABSOLUTE_GOAL_POSITION_RAM
+TELEMETRY_RAM = VOLTAGE_RAM
+TELEMETRY_LENGTH = ABSOLUTE_GOAL_POSITION_RAM + 2 - VOLTAGE_RAM
+# volts per unit of the voltage register
+VOLTAGE_SCALE = 0.074
+# seconds per unit of playtime
+PLAYTIME_UNIT = 0.0112
+
 BROADCAST_ID = 0xFE
 
-SERPORT = None
+# frame sizes, including header and checksums
+MIN_FRAME_SIZE = 9
+MAX_FRAME_SIZE = 223
+# how long to wait for a response, in seconds
+RESPONSE_TIMEOUT = 0.1
+# how long scan_servos first waits for each servo, in seconds,
+# shortened to SCAN_TIMEOUT_FACTOR times the response times seen, down to SCAN_MIN_TIMEOUT
+SCAN_TIMEOUT = 0.02
+SCAN_MIN_TIMEOUT = 0.003
+SCAN_TIMEOUT_FACTOR = 4
+# how many times the probe of an expected servo, or a model read, is retried, when a response is lost
+RETRIES = 2
+
+BUS = None
 
 def connect(portname, baudrate):
     """ Connect to the Herkulex bus
 
-    Connect to serial port to which Herkulex Servos are attatched
+    Connect to serial port to which Herkulex Servos are attatched.
+    This opens the default bus, used by the module functions
+    and by the servos created without a bus
 
     Args:
         portname (str): The serial port name
         baudrate (int): The serial port baudrate
     Raises:
-        SerialException: Error occured while opening serial port
+        HerkulexError: Error occured while opening serial port
     """
-    global SERPORT
-    try:
-        SERPORT = serial.Serial(portname, baudrate, timeout = 0.5)
-
-    except:
-        raise HerkulexError("could not open the serial port")
+    global BUS
+    BUS = HerkulexBus(portname, baudrate)
 
 def close():
-    """ Close the Serial port
+    """ Close the Serial port of the default bus
 
     Properly close the serial port before exiting the application
 
     Raises:
-        SerialException: Error occured while closing serial port
+        HerkulexError: Error occured while closing serial port
     """
-    try:
-        SERPORT.close()
-    except:
-        raise HerkulexError("could not close the serial port")
+    BUS.close()
 
 
 def checksum1(data, stringlength):
@@ -218,17 +241,19 @@ def checksum2(data):
 
 
 
-def send_data(data):
+def send_data(data, port=None):
     """ Send data to herkulex
 
     Paketize & write the packet to serial port
 
     Args:
         data (list): the data to be sent
+        port (Serial): the serial port, by default the one of the default bus
 
     Raises:
         SerialException: Error occured while opening serial port
     """
+    data = list(data)
     datalength = len(data)
     csm1 = checksum1(data, datalength)
     csm2 = checksum2(csm1)
@@ -236,26 +261,595 @@ def send_data(data):
     data.insert(1, 0xFF)
     data.insert(5, csm1)
     data.insert(6, csm2)
+    if port is None:
+        port = BUS.port
 
     try:
         if __PYTHON_3__:
-            SERPORT.reset_input_buffer()
-            SERPORT.reset_output_buffer()
-            SERPORT.write(bytearray(data))
+            port.write(bytearray(data))
         else:
             stringtosend = ""
             for i in range(len(data)):
                 byteformat = '%02X' % data[i]
                 stringtosend = stringtosend + "\\x" + byteformat
-                SERPORT.reset_input_buffer()
-                SERPORT.reset_output_buffer()
-                SERPORT.write(stringtosend.decode('string-escape'))
+                port.write(stringtosend.decode('string-escape'))
                 #print stringtosend
 
     except:
         raise HerkulexError("could not communicate with motors")
 
 
+class Frame(object):
+    """ A frame received from a servo
+
+    Attributes:
+        servoid (int): the id of the servo that sent the frame
+        cmd (int): the command of the frame, e.g. RAM_READ_ACK
+        data (bytearray): the frame data, ending with the status bytes
+        status_error (int): the status error byte, * refer datasheet
+        status_detail (int): the status detail byte, * refer datasheet
+    """
+
+    def __init__(self, servoid, cmd, data):
+        self.servoid = servoid
+        self.cmd = cmd
+        self.data = data
+        self.status_error = data[-2]
+        self.status_detail = data[-1]
+
+    @property
+    def values(self):
+        """ The register values of a read response, without address, length and status
+        """
+        return self.data[2:-2]
+
+    def matches(self, request):
+        """ Check if the frame is the response to a request
+
+        Args:
+            request (list): the request data, without header and checksums
+        """
+        if self.servoid != request[1] or self.cmd != request[2] | 0x40:
+            return False
+        if request[2] in (EEP_READ_REQ, RAM_READ_REQ):
+            return len(self.data) >= 4 and self.data[0] == request[3] and self.data[1] == request[4]
+        return True
+
+
+class FrameDecoder(object):
+    """ Streaming decoder of the frames received from the servos
+
+    Feed it the received bytes, it syncs on the 0xFF 0xFF header,
+    verifies the checksums and returns the complete frames.
+    Bytes that do not form a valid frame are dropped, and counted in garbled.
+
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.garbled = 0
+
+    def needed(self):
+        """ Get the number of bytes needed to complete the next frame
+
+        Returns:
+            int: the number of bytes, at least 1
+        """
+        if len(self.buffer) < 3:
+            return 3 - len(self.buffer)
+        return max(1, self.buffer[2] - len(self.buffer))
+
+    def feed(self, received):
+        """ Decode received bytes
+
+        Args:
+            received (bytes): the received bytes
+
+        Returns:
+            list: the frames completed by these bytes
+        """
+        self.buffer.extend(bytearray(received))
+        frames = []
+        while True:
+            start = self.buffer.find(b'\xff\xff')
+            if start < 0:
+                # keep a trailing 0xFF, it may be the start of a header
+                dropped = len(self.buffer) - 1 if self.buffer.endswith(b'\xff') else len(self.buffer)
+                if dropped > 0:
+                    self.garbled += 1
+                    del self.buffer[:dropped]
+                break
+            if start > 0:
+                self.garbled += 1
+                del self.buffer[:start]
+            if len(self.buffer) < 3:
+                break
+            size = self.buffer[2]
+            if size < MIN_FRAME_SIZE or size > MAX_FRAME_SIZE:
+                self.garbled += 1
+                del self.buffer[:1]
+                continue
+            if len(self.buffer) < size:
+                break
+            frame = self.buffer[:size]
+            csm1 = checksum1(frame[2:5] + frame[7:], size - 4)
+            if frame[5] != csm1 or frame[6] != checksum2(csm1):
+                self.garbled += 1
+                del self.buffer[:2]
+                continue
+            frames.append(Frame(frame[3], frame[4], frame[7:]))
+            del self.buffer[:size]
+        return frames
+
+
+def expects_response(data):
+    """ Check if a request is answered by the servos
+
+    Servos answer read and stat requests sent to their id
+
+    Args:
+        data (list): the request data, without header and checksums
+    """
+    return data[1] != BROADCAST_ID and data[2] in (EEP_READ_REQ, RAM_READ_REQ, STAT_REQ)
+
+
+# Bus request priorities, lower values are sent first
+PRIORITY_MOTION = 0
+PRIORITY_WRITE = 1
+PRIORITY_READ = 2
+# idle time between a write and the next packet, in seconds
+INTER_PACKET_GAP = 0.001
+
+def request_priority(data):
+    """ Get the bus priority of a request
+
+    Motion commands go first, then the other writes, then reads
+
+    Args:
+        data (list): the request data, without header and checksums
+
+    Returns:
+        int: the request priority
+    """
+    if data[2] in (I_JOG_REQ, S_JOG_REQ):
+        return PRIORITY_MOTION
+    if data[2] in (EEP_READ_REQ, RAM_READ_REQ, STAT_REQ):
+        return PRIORITY_READ
+    return PRIORITY_WRITE
+
+
+class BusRequest(object):
+    """ A request queued on the bus scheduler
+
+    Use wait to block until the request is sent and its response is read
+
+    """
+
+    def __init__(self, data, priority, sequence):
+        self.data = data
+        self.priority = priority
+        self.sequence = sequence
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def wait(self, timeout=None):
+        """ Wait for the request to complete
+
+        Args:
+            timeout (float): how long to wait in seconds, None waits forever
+
+        Returns:
+            Frame: the response, or None for requests without response
+
+        Raises:
+            HerkulexError: the request failed or timed out
+        """
+        if not self.done.wait(timeout):
+            raise HerkulexError("timed out waiting for the bus")
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class BusScheduler(object):
+    """ The bus scheduler
+
+    Queues requests and sends them back to back from a worker thread.
+    Queued motion commands are sent before other writes, and writes before reads.
+    Writes are followed only by a short gap, reads wait for their response
+    instead of a fixed sleep.
+
+    """
+
+    def __init__(self, bus):
+        """ bus scheduler initialization
+
+        Args:
+            bus (HerkulexBus): the bus
+        """
+        self.bus = bus
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """ Start the worker thread
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="herkulex")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """ Stop the worker thread, after the queued requests are sent
+        """
+        if self.thread is not None:
+            self.running = False
+            self.queue.put(BusRequest(None, PRIORITY_READ + 1, next(self.sequence)))
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, data, priority=None):
+        """ Queue a request
+
+        Args:
+            data (list): the request data, without header and checksums
+            priority (int): the request priority, by default from its command
+
+        Returns:
+            BusRequest: the queued request
+        """
+        if priority is None:
+            priority = request_priority(data)
+        request = BusRequest(data, priority, next(self.sequence))
+        self.queue.put(request)
+        return request
+
+    def execute(self, request):
+        """ Send a request and read its response
+        """
+        try:
+            request.response = self.bus.execute(request.data)
+        except HerkulexError as e:
+            request.error = e
+        except Exception:
+            request.error = HerkulexError("could not communicate with motors")
+        request.done.set()
+
+    def run(self):
+        while True:
+            request = self.queue.get()
+            if request.data is None:
+                if not self.running:
+                    break
+                continue
+            self.execute(request)
+
+
+class HerkulexBus(object):
+    """ The Herkulex bus
+
+    Owns the serial port to which Herkulex Servos are attached.
+    Requests are serialized by a lock, so servos on the same bus can be
+    used from several threads. Use start_scheduler to queue requests
+    by priority instead.
+
+    """
+
+    def __init__(self, portname=None, baudrate=115200, port=None):
+        """ bus initialization
+
+        Args:
+            portname (str): The serial port name
+            baudrate (int): The serial port baudrate
+            port (Serial): An already open serial port, instead of portname
+
+        Raises:
+            HerkulexError: Error occured while opening serial port
+        """
+        if port is None:
+            try:
+                port = serial.Serial(portname, baudrate, timeout = RESPONSE_TIMEOUT)
+            except:
+                raise HerkulexError("could not open the serial port")
+        self.port = port
+        self.lock = threading.RLock()
+        self.decoder = FrameDecoder()
+        self.scheduler = None
+        self.stats = {
+            "requests": 0,
+            "responses": 0,
+            "timeouts": 0,
+            "bytes_sent": 0,
+            "max_response_time": 0.0,
+        }
+
+    def close(self):
+        """ Close the Serial port
+
+        Properly close the serial port before exiting the application
+
+        Raises:
+            HerkulexError: Error occured while closing serial port
+        """
+        self.stop_scheduler()
+        try:
+            self.port.close()
+        except:
+            raise HerkulexError("could not close the serial port")
+
+    def get_stats(self):
+        """ Get the bus statistics
+
+        Returns:
+            dict: the number of requests, responses, timeouts, bytes sent
+                  and garbled frames, the longest response time in seconds,
+                  and the number of queued requests
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats["garbled"] = self.decoder.garbled
+        stats["queued"] = self.scheduler.queue.qsize() if self.scheduler is not None else 0
+        return stats
+
+    def read_response(self, data, timeout=RESPONSE_TIMEOUT):
+        """ Read the response to a request
+
+        Frames that do not answer the request, e.g. late responses to earlier
+        requests, are skipped
+
+        Args:
+            data (list): the request data, without header and checksums
+            timeout (float): how long to wait for the response, in seconds
+
+        Returns:
+            Frame: the response
+
+        Raises:
+            HerkulexError: no valid response was received before the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                received = self.port.read(self.decoder.needed())
+            except Exception:
+                raise HerkulexError("could not communicate with motors")
+            for frame in self.decoder.feed(received):
+                if frame.matches(data):
+                    return frame
+            if time.monotonic() >= deadline:
+                self.stats["timeouts"] += 1
+                raise HerkulexTimeout("no response from servo %d" % data[1])
+
+    def execute(self, data, timeout=RESPONSE_TIMEOUT):
+        """ Send a request and read its response, bypassing the scheduler
+
+        Args:
+            data (list): the request data, without header and checksums
+            timeout (float): how long to wait for the response, in seconds
+
+        Returns:
+            Frame: the response, or None for requests without response
+        """
+        with self.lock:
+            start = time.monotonic()
+            send_data(data, self.port)
+            self.stats["requests"] += 1
+            self.stats["bytes_sent"] += len(data) + 4
+            if not expects_response(data):
+                self.port.flush()
+                time.sleep(INTER_PACKET_GAP)
+                return None
+            frame = self.read_response(data, timeout)
+            self.stats["responses"] += 1
+            self.stats["max_response_time"] = max(self.stats["max_response_time"], time.monotonic() - start)
+            return frame
+
+    def transact(self, data):
+        """ Send a request and read its response
+
+        Goes through the bus scheduler when it is running
+
+        Args:
+            data (list): the request data, without header and checksums
+
+        Returns:
+            Frame: the response, or None for requests without response
+
+        Raises:
+            HerkulexError: Error occured while communicating with the servos
+        """
+        if self.scheduler is not None:
+            return self.scheduler.submit(data).wait()
+        return self.execute(data)
+
+    def start_scheduler(self):
+        """ Start the bus scheduler
+
+        Once started, requests are queued and sent by priority
+
+        """
+        if self.scheduler is None:
+            self.scheduler = BusScheduler(self)
+            self.scheduler.start()
+
+    def stop_scheduler(self):
+        """ Stop the bus scheduler
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+
+    def clear_errors(self):
+        """ Clears the errors register of all Herkulex servos on the bus
+
+        Args:
+            none
+
+        """
+        data = []
+        data.append(0x0B)
+        data.append(BROADCAST_ID)
+        data.append(RAM_WRITE_REQ)
+        data.append(STATUS_ERROR_RAM)
+        data.append(BYTE2)
+        data.append(0x00)
+        data.append(0x00)
+        self.transact(data)
+
+    def sync_move(self, moves, playtime):
+        """ Move several servos at once
+
+        Sends a single S_JOG packet, so all servos start moving at the same time
+        and take the same time to reach their goal
+
+        Args:
+            moves (list): a list of tuples of the form [(id, goalposition, led)]
+                          led (int): the LED color
+                                     0x00 LED off
+                                     0x04 GREEN
+                                     0x08 BLUE
+                                     0x10 RED
+            playtime (int): the time taken to move from present
+             position to goalposition
+        """
+        data = []
+        data.append(0x08 + 4 * len(moves))
+        data.append(BROADCAST_ID)
+        data.append(S_JOG_REQ)
+        data.append(int(playtime) & 0xFF)
+        for servoid, goalposition, led in moves:
+            data.append(int(goalposition) & 0xff)
+            data.append(int(goalposition) >> 8)
+            data.append(led)
+            data.append(servoid)
+        self.transact(data)
+
+    def ping(self, servoid, timeout=RESPONSE_TIMEOUT):
+        """ Check if a servo answers
+
+        Sends a STAT request, which has the shortest response
+
+        Args:
+            servoid(int): the id of the servo
+            timeout (float): how long to wait for the response, in seconds
+
+        Returns:
+            Frame: the response, or None if the servo did not answer
+        """
+        data = []
+        data.append(0x07)
+        data.append(servoid)
+        data.append(STAT_REQ)
+        try:
+            return self.execute(data, timeout)
+        except HerkulexTimeout:
+            return None
+
+    def scan_servos(self, ids=None, expected=None, timeout=SCAN_TIMEOUT):
+        """Scan for the herkulex servos connected
+
+        This function will scan for all the herkulex servos connected
+        to the bus. Each id is probed with a STAT request, the wait for
+        a response starts at timeout and is shortened once servos answer.
+        Broadcast requests are not answered, so each id is probed in turn.
+        Expected ids are probed up to RETRIES more times, so a lost response
+        does not skip a servo.
+
+        Args:
+            ids (list): the ids to probe, by default all of them
+            expected (list): the ids of the servos that should be found,
+                             the scan stops once they are all found
+            timeout (float): the first wait for each response, in seconds
+        Returns:
+            list: a list of tuples of the form [(id, model)],
+                  servos whose model can not be read are left out
+        """
+        if ids is None:
+            ids = range(0x00, BROADCAST_ID)
+        expected = set(expected) if expected is not None else None
+        found = []
+        with self.lock:
+            port_timeout = self.port.timeout
+            try:
+                for servo_id in ids:
+                    if self.port.timeout != timeout:
+                        self.port.timeout = timeout
+                    attempts = 1 + (RETRIES if expected is not None and servo_id in expected else 0)
+                    for _ in range(attempts):
+                        start = time.monotonic()
+                        if self.ping(servo_id, timeout) is not None:
+                            break
+                    else:
+                        continue
+                    found.append(servo_id)
+                    timeout = max(SCAN_MIN_TIMEOUT, min(timeout, SCAN_TIMEOUT_FACTOR * (time.monotonic() - start)))
+                    if expected is not None and expected.issubset(found):
+                        break
+            finally:
+                self.port.timeout = port_timeout
+        models = [(servo_id, self.get_model(servo_id)) for servo_id in found]
+        return [(servo_id, model) for servo_id, model in models if model is not None]
+
+    def get_model(self, servoid):
+        """ Get the servo model
+
+        This function gets the model of the herkules servo, provided its id.
+        The read is retried up to RETRIES times when a response is lost
+
+        Args:
+            servoid(int): the id of the servo
+
+        Returns:
+            int:  an integer corresponding to the model number
+                  0x06 for DRS-602
+                  0x04 for DRS-402
+                  0x02 for DRS-202
+                  None if the servo did not answer
+        """
+        data = []
+        data.append(0x09)
+        data.append(servoid)
+        data.append(EEP_READ_REQ)
+        data.append(MODEL_NO1_EEP)
+        data.append(BYTE1)
+        for _ in range(1 + RETRIES):
+            try:
+                frame = self.transact(data)
+            except HerkulexTimeout:
+                continue
+            except:
+                raise HerkulexError("could not communicate with motors")
+            return frame.values[0]&0xFF
+        return None
+
+
+def start_scheduler():
+    """ Start the scheduler of the default bus
+    """
+    BUS.start_scheduler()
+
+def stop_scheduler():
+    """ Stop the scheduler of the default bus
+    """
+    BUS.stop_scheduler()
+
+def transact(data):
+    """ Send a request on the default bus and read its response
+
+    Args:
+        data (list): the request data, without header and checksums
+
+    Returns:
+        Frame: the response, or None for requests without response
+    """
+    return BUS.transact(data)
+
 def clear_errors():
     """ Clears the errors register of all Herkulex servos
 
@@ -263,15 +857,17 @@ def clear_errors():
         none
 
     """
-    data = []
-    data.append(0x0B)
-    data.append(BROADCAST_ID)
-    data.append(RAM_WRITE_REQ)
-    data.append(STATUS_ERROR_RAM)
-    data.append(BYTE2)
-    data.append(0x00)
-    data.append(0x00)
-    send_data(data)
+    BUS.clear_errors()
+
+def sync_move(moves, playtime):
+    """ Move several servos of the default bus at once
+
+    Args:
+        moves (list): a list of tuples of the form [(id, goalposition, led)]
+        playtime (int): the time taken to move from present
+         position to goalposition
+    """
+    BUS.sync_move(moves, playtime)
 
 def scale(input_value, input_min, input_max, out_min, out_max):
     """ scale a value from one range to another
@@ -284,29 +880,26 @@ def scale(input_value, input_min, input_max, out_min, out_max):
     # Convert the 0-1 range into a value in the right range.
     return out_min + (valuescaled * output_span)
 
-def scan_servos():
+def scan_servos(ids=None, expected=None):
 
     """Scan for the herkulex servos connected
 
 	This function will scan for all the herkulex servos connected
-	to the bus.
+	to the default bus.
 
 	Args:
-	    none
+	    ids (list): the ids to probe, by default all of them
+	    expected (list): the ids of the servos that should be found
 	Returns:
-	    list: a list of tuples of the form [(id, model)]
+	    list: a list of tuples of the form [(id, model)],
+	          servos whose model can not be read are left out
 	"""
-    servos = []
-    for servo_id in range(0x00, 0xFE):
-        model = get_model(servo_id)
-        if model:
-            servos += [(servo_id, model)]
-    return servos
+    return BUS.scan_servos(ids, expected)
 
 def get_model(servoid):
     """ Get the servo model
 
-    This function gets the model of the herkules servo, provided its id
+    This function gets the model of the herkules servo of the default bus, provided its id
 
     Args:
         servoid(int): the id of the servo
@@ -316,75 +909,105 @@ def get_model(servoid):
               0x06 for DRS-602
               0x04 for DRS-402
               0x02 for DRS-202
+              None if the servo did not answer
     """
-    data = []
-    data.append(0x09)
-    data.append(servoid)
-    data.append(EEP_READ_REQ)
-    data.append(MODEL_NO1_EEP)
-    data.append(BYTE1)
-    send_data(data)
-    rxdata = []
-    try:
-        rxdata = SERPORT.read(12)
-        return ord(rxdata[9])&0xFF
-    except:
-        raise HerkulexError("could not communicate with motors")
-
-def status_error(error):
-    if error == 0:
-        print("no error")
-    else:
-        error_b = bin(error)
-        l = len(error_b)
-        if error_b[l-1] == '1':
-            print("Exceed Input Voltage limit")
+    return BUS.get_model(servoid)
 
-        if error_b[l-2] == '1':
-            print("Exceed allowed POT limit")
 
-        if error_b[l-3] == '1':
-            print("Exceed Temperature limit")
-
-        if error_b[l-4] == '1':
-            print("Invalid Packet")
-            print(" Call status_error_detail to know more")
+class StatusError(enum.IntFlag):
+    """ Flags of the status error register
+    """
+    EXCEED_INPUT_VOLTAGE = 0x01
+    EXCEED_POT_LIMIT = 0x02
+    EXCEED_TEMPERATURE = 0x04
+    INVALID_PACKET = 0x08
+    OVERLOAD = 0x10
+    DRIVER_FAULT = 0x20
+    EEP_REG_DISTORTED = 0x40
+
+class StatusDetail(enum.IntFlag):
+    """ Flags of the status detail register
+
+    Invalid packets set CHECKSUM_ERROR, UNKNOWN_COMMAND,
+    EXCEED_REG_RANGE or GARBAGE_DETECTED
+    """
+    MOVING = 0x01
+    INPOSITION = 0x02
+    CHECKSUM_ERROR = 0x04
+    UNKNOWN_COMMAND = 0x08
+    EXCEED_REG_RANGE = 0x10
+    GARBAGE_DETECTED = 0x20
+    MOTOR_ON = 0x40
+
+# decoded flags of every register value
+STATUS_ERRORS = tuple(StatusError(value) for value in range(256))
+STATUS_DETAILS = tuple(StatusDetail(value) for value in range(256))
 
-        if error_b[l-5] == '1':
-            print("Overload detected")
+def status_error(error):
+    """ Decode the status error register
 
-        if error_b[l-6] == '1':
-            print("Driver fault detected")
+    Args:
+        error (int): the status error register
 
-        if error_b[l-7] == '1':
-            print("EEP REG distorted")
+    Returns:
+        StatusError: the error flags, e.g. StatusError.OVERLOAD in status_error(error)
+    """
+    return STATUS_ERRORS[error & 0xFF]
 
 def status_error_detail(error):
-    if error == 0:
-        print("no error")
-    else:
-        error_b = bin(error)
-        l = len(error_b)
-        if error_b[l-1] == '1':
-            print("Moving flag")
+    """ Decode the status detail register
 
-        if error_b[l-2] == '1':
-            print("Inposition flag")
+    Args:
+        error (int): the status detail register
 
-        if error_b[l-3] == '1':
-            print("Checksum Error")
+    Returns:
+        StatusDetail: the detail flags, e.g. StatusDetail.MOVING in status_error_detail(error)
+    """
+    return STATUS_DETAILS[error & 0xFF]
 
-        if error_b[l-4] == '1':
-            print("Unknown Command")
 
-        if error_b[l-5] == '1':
-            print("Exceed REG range")
+# position and angle ranges of each model, DRS-0602 and DRS-0402 have 15 bit positions
+POSITION_RANGES = {
+    0x06: (10627, 22129, -159.9, 159.6),
+    0x04: (10627, 22129, -159.9, 159.6),
+}
+DEFAULT_POSITION_RANGE = (21, 1002, -150, 150)
 
-        if error_b[l-6] == '1':
-            print("Garbage detected")
+def angle_conversion(model):
+    """ Get the conversion between positions and angles of a model
 
-        if error_b[l-7] == '1':
-            print("MOTOR_ON flag")  
+    Args:
+        model (int): the servo model
+
+    Returns:
+        tuple: the degrees per position count, and the angle at position 0
+    """
+    position_min, position_max, angle_min, angle_max = POSITION_RANGES.get(model, DEFAULT_POSITION_RANGE)
+    degrees_per_count = float(angle_max - angle_min) / (position_max - position_min)
+    return degrees_per_count, angle_min - position_min * degrees_per_count
+
+Telemetry = collections.namedtuple("Telemetry", [
+    "voltage",
+    "temperature",
+    "position",
+    "angle",
+    "torque",
+    "goal_position",
+    "status_error",
+    "status_detail",
+])
+Telemetry.__doc__ = """ Servo telemetry, read by servo.read_telemetry
+
+    Attributes:
+        voltage (float): the input voltage, in volts
+        temperature (int): the temperature register
+        position (int): the calibrated position
+        angle (float): the calibrated position, in degrees
+        torque (int): the PWM applied to the motor, range -1023 to 1023
+        goal_position (int): the absolute goal position
+        status_error (StatusError): the error flags
+        status_detail (StatusDetail): the detail flags
+"""
 
 
 class servo:
@@ -395,16 +1018,21 @@ class servo:
     """
 
 
-    def __init__(self, servoid):
+    def __init__(self, servoid, bus=None):
         """ servo class initialization
 
    	Args:
    	    servoid(int): the id of the servo
+   	    bus(HerkulexBus): the bus of the servo, by default the one opened by connect
    	"""
         self.servoid = servoid
+        self.bus = bus if bus is not None else BUS
 
 
-        self.servomodel = get_model(servoid)
+        self.servomodel = self.bus.get_model(servoid)
+        if self.servomodel is None:
+            raise HerkulexError("could not communicate with servo %d" % servoid)
+        self.degrees_per_count, self.angle_offset = angle_conversion(self.servomodel)
 
 
 
@@ -433,12 +1061,9 @@ class servo:
         data.append(EEP_READ_REQ)
         data.append(MODEL_NO1_EEP)
         data.append(BYTE1)
-        send_data(data)
-
-        rxdata = []
         try:
-            rxdata = SERPORT.read(12)
-            return ord(rxdata[9])&0xFF
+            frame = self.bus.transact(data)
+            return frame.values[0]&0xFF
         except:
             raise HerkulexError("could not communicate with motors")
 
@@ -452,8 +1077,7 @@ class servo:
             none
 
         Returns:
-            int:  an integer corresponding to the servo status
-                   * refer datasheet
+            StatusError: the error flags of the servo
 
         """
         data = []
@@ -462,16 +1086,8 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(STATUS_ERROR_RAM)
         data.append(BYTE1)
-        send_data(data)
-
-        rxdata = []
-        #try:
-        rxdata = SERPORT.read(12)
-        state = ord(rxdata[9])&0xFF
-        status_error(state)
-        return state
-        #except:
-            #raise HerkulexError("could not communicate with motors")
+        frame = self.bus.transact(data)
+        return status_error(frame.values[0])
 
     def get_servo_status_detail(self):
         """ Get the  detailed error status of servo
@@ -482,8 +1098,7 @@ class servo:
             none
 
         Returns:
-            int:  an integer corresponding to the servo status
-                   * refer datasheet
+            StatusDetail: the detail flags of the servo
 
         """
 
@@ -493,13 +1108,9 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(STATUS_DETAIL_RAM)
         data.append(BYTE1)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(12)
-            state = ord(rxdata[9])&0xFF
-            status_error_detail(state)
-            return state
+            frame = self.bus.transact(data)
+            return status_error_detail(frame.values[0])
         except HerkulexError:
             raise HerkulexError("could not communicate with motors")
 
@@ -523,7 +1134,7 @@ class servo:
         data.append(LED_CONTROL_RAM)
         data.append(0x01)
         data.append(colorcode)
-        send_data(data)
+        self.bus.transact(data)
         
     def set_max_acceleration_time(self, time):
         """ Set the max acceleration time of Herkulex
@@ -538,7 +1149,7 @@ class servo:
         data.append(MAX_ACCELERATION_TIME_RAM)
         data.append(0x01)
         data.append(time)
-        send_data(data)
+        self.bus.transact(data)
 
 
     def brake_on(self):
@@ -557,7 +1168,7 @@ class servo:
         data.append(TORQUE_CONTROL_RAM)
         data.append(0x01)
         data.append(0x40)
-        send_data(data)
+        self.bus.transact(data)
 
     def torque_off(self):
         """ Set the torques of Herkulex to zero
@@ -576,7 +1187,7 @@ class servo:
         data.append(TORQUE_CONTROL_RAM)
         data.append(0x01)
         data.append(0x00)
-        send_data(data)
+        self.bus.transact(data)
 
     def torque_on(self):
         """ Enable the torques of Herkulex
@@ -594,7 +1205,7 @@ class servo:
         data.append(TORQUE_CONTROL_RAM)
         data.append(0x01)
         data.append(0x60)
-        send_data(data)
+        self.bus.transact(data)
 
     def get_torque_state(self):
         """ get the torque state of motor
@@ -608,11 +1219,9 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(TORQUE_CONTROL_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
-            return bool(ord(rxdata[9]))
+            frame = self.bus.transact(data)
+            return bool(frame.values[0])
         except HerkulexError:
             raise HerkulexError("could not communicate with motors")
 
@@ -644,7 +1253,7 @@ class servo:
         data.append(led)
         data.append(self.servoid)
         data.append(goaltime)
-        send_data(data)
+        self.bus.transact(data)
 
     def get_servo_position(self):
         """ Gets the current position of Herkulex
@@ -659,26 +1268,69 @@ class servo:
             SerialException: Error occured while opening serial port
 
         """
-        #global SERPORT
-
         data = []
         data.append(0x09)
         data.append(self.servoid)
         data.append(RAM_READ_REQ)
         data.append(CALIBRATED_POSITION_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
+            frame = self.bus.transact(data)
             if (self.servomodel==0x06) or (self.servomodel == 0x04):
-                return ((ord(rxdata[10])&0xff)<<8) | (ord(rxdata[9])&0xFF)
+                return ((frame.values[1]&0xff)<<8) | (frame.values[0]&0xFF)
             else:
-                #print ord(rxdata[9]),ord(rxdata[10])
-                return ((ord(rxdata[10])&0x03)<<8) | (ord(rxdata[9])&0xFF)
+                #print frame.values[0],frame.values[1]
+                return ((frame.values[1]&0x03)<<8) | (frame.values[0]&0xFF)
 
         except HerkulexError:
-            print ("Could not read from the servos. Check connection")
+            raise HerkulexError("Could not read from the servos. Check connection")
+
+    def read_telemetry(self):
+        """ Reads the telemetry of Herkulex in a single request
+
+        Reads the RAM block from VOLTAGE_RAM to ABSOLUTE_GOAL_POSITION_RAM
+
+        Args:
+            none
+
+        Returns:
+            Telemetry: the servo telemetry
+
+        Raises:
+            HerkulexError: Error occured while communicating with the servo
+
+        """
+        data = []
+        data.append(0x09)
+        data.append(self.servoid)
+        data.append(RAM_READ_REQ)
+        data.append(TELEMETRY_RAM)
+        data.append(TELEMETRY_LENGTH)
+        frame = self.bus.transact(data)
+        values = frame.values
+        if len(values) != TELEMETRY_LENGTH:
+            raise HerkulexError("invalid telemetry from servo %d" % self.servoid)
+
+        def register(address):
+            offset = address - TELEMETRY_RAM
+            return values[offset] | (values[offset + 1] << 8)
+
+        position = register(CALIBRATED_POSITION_RAM)
+        if (self.servomodel != 0x06) and (self.servomodel != 0x04):
+            position &= 0x3FF
+        torque = register(PWM_RAM)
+        if torque >= 0x8000:
+            torque -= 0x10000
+        return Telemetry(
+            voltage=values[VOLTAGE_RAM - TELEMETRY_RAM] * VOLTAGE_SCALE,
+            temperature=values[TEMPERATURE_RAM - TELEMETRY_RAM],
+            position=position,
+            angle=self.position_to_angle(position),
+            torque=torque,
+            goal_position=register(ABSOLUTE_GOAL_POSITION_RAM),
+            status_error=status_error(frame.status_error),
+            status_detail=status_error_detail(frame.status_detail),
+        )
 
     def get_servo_temperature(self):
         """ Gets the current temperature of Herkulex
@@ -699,11 +1351,9 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(TEMPERATURE_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
-            return ord(rxdata[9])
+            frame = self.bus.transact(data)
+            return frame.values[0]
         except HerkulexError:
             raise HerkulexError("Could not communicate with motors")
 
@@ -729,14 +1379,12 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(PWM_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
-            if ord(rxdata[10])<=127:
-                return ((ord(rxdata[10])&0x03)<<8) | (ord(rxdata[9])&0xFF)
+            frame = self.bus.transact(data)
+            if frame.values[1]<=127:
+                return ((frame.values[1]&0x03)<<8) | (frame.values[0]&0xFF)
             else:
-                return (ord(rxdata[10])-0xFF)*0xFF + (ord(rxdata[9])&0xFF)-0xFF
+                return (frame.values[1]-0xFF)*0xFF + (frame.values[0]&0xFF)-0xFF
         except HerkulexError:
             raise HerkulexError("could not communicate with motors")
 
@@ -770,7 +1418,7 @@ class servo:
         data.append(0x02|led)
         data.append(self.servoid)
         data.append(0x00)
-        send_data(data)
+        self.bus.transact(data)
 
     def set_position_p(self, pvalue):
         """ Set the P gain of the  position PID
@@ -789,7 +1437,7 @@ class servo:
         data.append(BYTE2)
         data.append( pvalue_lsb)
         data.append( pvalue_msb)
-        send_data(data)
+        self.bus.transact(data)
 
     def set_position_i(self, ivalue):
         """ Set the I gain of the position PID
@@ -808,7 +1456,7 @@ class servo:
         data.append(BYTE2)
         data.append(ivalue_lsb)
         data.append(ivalue_msb)
-        send_data(data)
+        self.bus.transact(data)
 
     def set_position_d(self, dvalue):
         """ Set the D gain of the PID
@@ -826,7 +1474,7 @@ class servo:
         data.append(BYTE2)
         data.append(dvalue_lsb)
         data.append(dvalue_msb)
-        send_data(data)
+        self.bus.transact(data)
 
     def get_position_p(self):
         """ Get the P value of the current PID for position
@@ -838,11 +1486,9 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(POSITION_KP_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
-            return (ord(rxdata[10])*256)+(ord(rxdata[9])&0xff)
+            frame = self.bus.transact(data)
+            return (frame.values[1]*256)+(frame.values[0]&0xff)
         except HerkulexError:
             raise HerkulexError("could not communicate with motors")
 
@@ -856,11 +1502,9 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(POSITION_KI_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
-            return (ord(rxdata[10])*256)+(ord(rxdata[9])&0xff)
+            frame = self.bus.transact(data)
+            return (frame.values[1]*256)+(frame.values[0]&0xff)
         except HerkulexError:
             raise HerkulexError("Could not read from motors")
 
@@ -874,11 +1518,9 @@ class servo:
         data.append(RAM_READ_REQ)
         data.append(POSITION_KD_RAM)
         data.append(BYTE2)
-        send_data(data)
-        rxdata = []
         try:
-            rxdata = SERPORT.read(13)
-            return (ord(rxdata[10])*256)+(ord(rxdata[9])&0xff)
+            frame = self.bus.transact(data)
+            return (frame.values[1]*256)+(frame.values[0]&0xff)
         except HerkulexError:
             raise HerkulexError("could not communicate with motors")
 
@@ -902,7 +1544,7 @@ class servo:
         data_p.append(BYTE2)
         data_p.append( pvalue_lsb)
         data_p.append( pvalue_msb)
-        send_data(data_p)
+        self.bus.transact(data_p)
 
         # write I value
         ivalue_msb = int(ival) >> 8
@@ -916,7 +1558,7 @@ class servo:
         data_i.append(BYTE2)
         data_i.append( ivalue_lsb)
         data_i.append( ivalue_msb)
-        send_data(data_i)
+        self.bus.transact(data_i)
 
         # write D value
         dvalue_msb = int(dval) >> 8
@@ -930,7 +1572,7 @@ class servo:
         data_d.append(BYTE2)
         data_d.append( dvalue_lsb)
         data_d.append( dvalue_msb)
-        send_data(data_d)
+        self.bus.transact(data_d)
 
     def set_servo_angle(self, goalangle, goaltime, led):
         """ Sets the servo angle (in degrees)
@@ -947,12 +1589,17 @@ class servo:
                        0x08 BLUE
                        0x10 RED
         """
-        if (self.servomodel==0x06) or (self.servomodel == 0x04):
-            goalposition = scale(goalangle, -159.9, 159.6, 10627, 22129)
-        else:
-            goalposition = scale(goalangle, -150, 150, 21, 1002)
+        self.set_servo_position(self.angle_to_position(goalangle), goaltime, led)
 
-        self.set_servo_position(goalposition, goaltime, led)
+    def angle_to_position(self, angle):
+        """ Converts an angle (in degrees) to a servo position
+
+        Args:
+            angle (float): the angle in degrees
+        Returns:
+            float: the servo position
+        """
+        return (angle - self.angle_offset) / self.degrees_per_count
 
     def get_servo_angle(self):
         """ Gets the current angle of the servo in degrees
@@ -963,11 +1610,17 @@ class servo:
             int : the current servo angle
         """
 
-        servoposition =  self.get_servo_position()
-        if (self.servomodel==0x06) or (self.servomodel == 0x04):
-            return scale(servoposition, 10627, 22129, -159.9, 159.6)
-        else:
-            return scale(servoposition, 21, 1002, -150, 150)
+        return self.position_to_angle(self.get_servo_position())
+
+    def position_to_angle(self, position):
+        """ Converts a servo position to an angle (in degrees)
+
+        Args:
+            position (int): the servo position
+        Returns:
+            float: the angle in degrees
+        """
+        return position * self.degrees_per_count + self.angle_offset
 
 class HerkulexError(Exception):
     """ Class to handle sservo errors
@@ -977,3 +1630,8 @@ class HerkulexError(Exception):
         self.message = message
 
 
+
+
+class HerkulexTimeout(HerkulexError):
+    """ Class to handle servos that do not answer
+    """
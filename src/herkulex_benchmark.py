@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+
+
+"""
+
+Herkulex benchmark.
+
+Measures the latency of the herkulex bus requests used by driver_pan_tilt, and reports percentiles.
+
+Runs against simulated servos by default, see herkulex_sim.py, so it runs on any Linux box.
+Use --port to run against the real servos instead, with driver_pan_tilt stopped.
+
+Use --output to save the results as json, to compare them between changes.
+
+usage: python3 herkulex_benchmark.py [--port <port>] [--ids <pan> <tilt>] [--latency <s>] [--iterations <n>] [--output <file>]
+
+"""
+
+
+import argparse
+import json
+import platform
+import threading
+import time
+
+import herkulex as hx
+import herkulex_sim as sim
+from middleware_benchmark import measure, print_results
+
+
+def run_benchmarks(bus, ids, iterations):
+    """
+    Run all benchmarks, returns a dictionary with the statistics of each one.
+    """
+    pan = hx.servo(ids[0], bus)
+    tilt = hx.servo(ids[1], bus)
+    pan.torque_on()
+    tilt.torque_on()
+    center = (pan.angle_to_position(0), tilt.angle_to_position(0))
+
+    def get_servo_angle():
+        pan.get_servo_angle()
+
+    def read_telemetry():
+        pan.read_telemetry()
+
+    def sync_move():
+        bus.sync_move([(pan.servoid, center[0], 0), (tilt.servoid, center[1], 0)], 10)
+
+    def control_loop():
+        # one driver_pan_tilt cycle: a move and the telemetry of both servos
+        sync_move()
+        pan.read_telemetry()
+        tilt.read_telemetry()
+
+    def scheduled_move():
+        # a move queued behind telemetry reads from another thread
+        sync_move()
+
+    results = {}
+    for name, function in (
+        ("get_servo_angle", get_servo_angle),
+        ("read_telemetry", read_telemetry),
+        ("sync_move", sync_move),
+        ("control_loop", control_loop),
+    ):
+        results[name] = measure(function, iterations)
+
+    bus.start_scheduler()
+    running = True
+
+    def poll_telemetry():
+        while running:
+            pan.read_telemetry()
+            tilt.read_telemetry()
+
+    poller = threading.Thread(target=poll_telemetry, daemon=True)
+    poller.start()
+    try:
+        results["scheduled_move"] = measure(scheduled_move, iterations)
+    finally:
+        running = False
+        poller.join()
+        bus.stop_scheduler()
+    pan.torque_off()
+    tilt.torque_off()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the herkulex bus.")
+    parser.add_argument("--port", help="serial port of real servos, simulated servos are used by default")
+    parser.add_argument("--baudrate", type=int, default=115200, help="baudrate (default: 115200)")
+    parser.add_argument("--ids", type=int, nargs=2, default=[3, 4], help="pan and tilt servo ids (default: 3 4)")
+    parser.add_argument("--latency", type=float, default=0.0, help="extra latency of simulated servos in seconds (default: 0)")
+    parser.add_argument("--iterations", type=int, default=200, help="iterations per benchmark (default: 200)")
+    parser.add_argument("--output", help="save the results to a json file")
+    args = parser.parse_args()
+
+    simulator = None
+    port = args.port
+    if port is None:
+        simulator = sim.SimulatedBus([sim.SimulatedServo(i) for i in args.ids], args.baudrate, args.latency)
+        simulator.start()
+        port = simulator.port_name
+    bus = hx.HerkulexBus(port, args.baudrate)
+    try:
+        results = run_benchmarks(bus, args.ids, args.iterations)
+        stats = bus.get_stats()
+    finally:
+        bus.close()
+        if simulator is not None:
+            simulator.stop()
+    print_results(results)
+    print(f'bus: {stats}')
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "backend": "simulator" if simulator is not None else "servos",
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+                "time": time.time(),
+                "results": results,
+                "bus": stats,
+            }, f, indent=2)
@@ -0,0 +1,334 @@
+#! /usr/bin/env python
+
+
+"""
+
+Herkulex simulator.
+
+Simulates Herkulex servos on a pseudo-terminal, so the herkulex library and driver_pan_tilt can run without the robot.
+
+Implements the packet protocol used by herkulex.py: EEP and RAM read and write, I_JOG, S_JOG, STAT, ROLLBACK and REBOOT.
+Servos follow position moves with linear trajectories, timed by the playtime of the move.
+Responses are delayed by the wire time at the simulated baudrate, plus a configurable latency.
+Responses can be dropped or corrupted at random, to exercise the error paths.
+
+Run it from the command line and connect to the printed pty, e.g. python3 driver_pan_tilt.py /dev/pts/3
+
+usage: python3 herkulex_sim.py [--ids <id> ...] [--latency <s>] [--drop-rate <p>] [--error-rate <p>]
+
+"""
+
+
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+import herkulex as hx
+
+
+# PWM reported while moving
+MOVING_PWM = 200
+
+EEP_SIZE = 54
+RAM_SIZE = 74
+
+
+class SimulatedServo:
+    """
+    SimulatedServo class.
+    Holds the EEP and RAM registers of a servo, and follows its position moves.
+    Position moves only happen while torque is on.
+    """
+
+    def __init__(self, servoid, model=0x06, position=16384, temperature=40, voltage=160):
+        self.servoid = servoid
+        self.model = model
+        self.initial_position = position
+        self.temperature = temperature
+        self.voltage = voltage
+        self.reset()
+
+    def reset(self):
+        """
+        Set the registers to their defaults.
+        """
+        self.eep = bytearray(EEP_SIZE)
+        self.eep[hx.MODEL_NO1_EEP] = self.model
+        self.eep[hx.MODEL_NO2_EEP] = 0x01
+        self.eep[hx.SERVO_ID_EEP] = self.servoid
+        self.eep[hx.ACK_POLICY_EEP] = 1
+        self.ram = bytearray(RAM_SIZE)
+        self.ram[hx.SERVO_ID_RAM] = self.servoid
+        self.ram[hx.ACK_POLICY_RAM] = 1
+        self.ram[hx.VOLTAGE_RAM] = self.voltage
+        self.ram[hx.TEMPERATURE_RAM] = self.temperature
+        self.start_position = self.initial_position
+        self.goal_position = self.initial_position
+        self.start_time = 0.0
+        self.playtime = 0.0
+        self.update()
+
+    def write_register(self, registers, address, value):
+        registers[address] = value & 0xFF
+        registers[address + 1] = (value >> 8) & 0xFF
+
+    def position(self, now):
+        """
+        Get the position along the current move.
+        """
+        if self.playtime <= 0 or now >= self.start_time + self.playtime:
+            return self.goal_position
+        progress = (now - self.start_time) / self.playtime
+        return int(round(self.start_position + (self.goal_position - self.start_position) * progress))
+
+    def update(self):
+        """
+        Update the position, PWM and status registers.
+        """
+        now = time.monotonic()
+        position = self.position(now)
+        moving = position != self.goal_position
+        pwm = 0
+        if moving:
+            pwm = MOVING_PWM if self.goal_position > position else -MOVING_PWM
+        self.write_register(self.ram, hx.CALIBRATED_POSITION_RAM, position)
+        self.write_register(self.ram, hx.ABSOLUTE_POSITION_RAM, position)
+        self.write_register(self.ram, hx.PWM_RAM, pwm & 0xFFFF)
+        self.write_register(self.ram, hx.ABSOLUTE_GOAL_POSITION_RAM, self.goal_position)
+        self.write_register(self.ram, hx.ABSOLUTE_DESIRED_TRAJECTORY_POSITION, position)
+        detail = self.ram[hx.STATUS_DETAIL_RAM] & ~(hx.StatusDetail.MOVING | hx.StatusDetail.INPOSITION | hx.StatusDetail.MOTOR_ON)
+        detail |= hx.StatusDetail.MOVING if moving else hx.StatusDetail.INPOSITION
+        if self.torque_on():
+            detail |= hx.StatusDetail.MOTOR_ON
+        self.ram[hx.STATUS_DETAIL_RAM] = detail
+
+    def torque_on(self):
+        return self.ram[hx.TORQUE_CONTROL_RAM] == 0x60
+
+    def move(self, position, playtime):
+        """
+        Start a move to position, taking playtime units.
+        """
+        if not self.torque_on():
+            return
+        now = time.monotonic()
+        self.start_position = self.position(now)
+        self.goal_position = position
+        self.start_time = now
+        self.playtime = playtime * hx.PLAYTIME_UNIT
+
+    def status(self):
+        self.update()
+        return [self.ram[hx.STATUS_ERROR_RAM], self.ram[hx.STATUS_DETAIL_RAM]]
+
+    def flag_error(self, error, detail):
+        self.ram[hx.STATUS_ERROR_RAM] |= error
+        self.ram[hx.STATUS_DETAIL_RAM] |= detail
+
+    def handle(self, cmd, data):
+        """
+        Handle a request addressed to this servo.
+        Returns the response data, without status, or None if the servo does not answer.
+        """
+        if cmd in (hx.EEP_READ_REQ, hx.RAM_READ_REQ, hx.EEP_WRITE_REQ, hx.RAM_WRITE_REQ):
+            if len(data) < 2:
+                self.flag_error(hx.StatusError.INVALID_PACKET, hx.StatusDetail.EXCEED_REG_RANGE)
+                return None
+            registers = self.eep if cmd in (hx.EEP_READ_REQ, hx.EEP_WRITE_REQ) else self.ram
+            address, length = data[0], data[1]
+            if address + length > len(registers):
+                self.flag_error(hx.StatusError.INVALID_PACKET, hx.StatusDetail.EXCEED_REG_RANGE)
+                return None
+            if cmd in (hx.EEP_READ_REQ, hx.RAM_READ_REQ):
+                self.update()
+                return [address, length] + list(registers[address:address + length])
+            registers[address:address + length] = bytes(data[2:2 + length])
+            if registers is self.ram and address <= hx.TORQUE_CONTROL_RAM < address + length and not self.torque_on():
+                # torque off stops the current move
+                self.goal_position = self.position(time.monotonic())
+                self.playtime = 0.0
+            return []
+        if cmd == hx.STAT_REQ:
+            return []
+        if cmd in (hx.ROLLBACK_REQ, hx.REBOOT_REQ):
+            self.reset()
+            return []
+        self.flag_error(hx.StatusError.INVALID_PACKET, hx.StatusDetail.UNKNOWN_COMMAND)
+        return None
+
+    def answers(self, cmd):
+        """
+        Check if the servo answers a command, given its ack policy.
+        """
+        policy = self.ram[hx.ACK_POLICY_RAM]
+        if cmd == hx.STAT_REQ:
+            return True
+        if cmd in (hx.EEP_READ_REQ, hx.RAM_READ_REQ):
+            return policy >= 1
+        return policy >= 2
+
+
+class SimulatedBus:
+    """
+    SimulatedBus class.
+    Serves the simulated servos on a pseudo-terminal, open port_name with pyserial or herkulex.HerkulexBus.
+    latency is added to the wire time of each response, in seconds.
+    drop_rate and error_rate are the probabilities of dropping a response or corrupting its checksum.
+    Use start() and stop(), or use it as a context manager.
+    """
+
+    def __init__(self, servos, baudrate=115200, latency=0.0, drop_rate=0.0, error_rate=0.0):
+        self.servos = {s.servoid: s for s in servos}
+        self.baudrate = baudrate
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        self.buffer = bytearray()
+        self.running = False
+        self.thread = None
+        self.stats = {"requests": 0, "responses": 0, "dropped": 0, "corrupted": 0, "invalid": 0}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="herkulex_sim", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def wire_time(self, length):
+        """
+        Time to transmit length bytes, with 1 start and 1 stop bit.
+        """
+        return length * 10.0 / self.baudrate
+
+    def run(self):
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                received = os.read(self.master, 1024)
+            except OSError:
+                break
+            self.buffer.extend(received)
+            for packet in self.parse():
+                self.dispatch(packet)
+
+    def parse(self):
+        """
+        Extract the complete packets from the receive buffer.
+        """
+        packets = []
+        while True:
+            start = self.buffer.find(b'\xff\xff')
+            if start < 0:
+                del self.buffer[:-1]
+                break
+            del self.buffer[:start]
+            if len(self.buffer) < 3:
+                break
+            size = self.buffer[2]
+            if size < 7 or size > hx.MAX_FRAME_SIZE:
+                del self.buffer[:1]
+                continue
+            if len(self.buffer) < size:
+                break
+            packets.append(bytes(self.buffer[:size]))
+            del self.buffer[:size]
+        return packets
+
+    def dispatch(self, packet):
+        """
+        Handle a request packet, and send the responses.
+        """
+        self.stats["requests"] += 1
+        servoid, cmd, data = packet[3], packet[4], bytearray(packet[7:])
+        csm1 = hx.checksum1(bytearray(packet[2:5]) + data, len(packet) - 4)
+        if packet[5] != csm1 or packet[6] != hx.checksum2(csm1):
+            self.stats["invalid"] += 1
+            for servo in self.targets(servoid):
+                servo.flag_error(hx.StatusError.INVALID_PACKET, hx.StatusDetail.CHECKSUM_ERROR)
+            return
+        if cmd == hx.I_JOG_REQ:
+            # entries of position lsb, msb, set, id, playtime
+            for i in range(0, len(data) - 4, 5):
+                for servo in self.targets(data[i + 3]):
+                    servo.move(data[i] | (data[i + 1] << 8), data[i + 4])
+            return
+        if cmd == hx.S_JOG_REQ:
+            # playtime, then entries of position lsb, msb, set, id
+            for i in range(1, len(data) - 3, 4):
+                for servo in self.targets(data[i + 3]):
+                    servo.move(data[i] | (data[i + 1] << 8), data[0])
+            return
+        for servo in self.targets(servoid):
+            response = servo.handle(cmd, data)
+            if response is not None and servoid != hx.BROADCAST_ID and servo.answers(cmd):
+                self.respond(servo.servoid, cmd | 0x40, response + servo.status())
+
+    def targets(self, servoid):
+        if servoid == hx.BROADCAST_ID:
+            return list(self.servos.values())
+        servo = self.servos.get(servoid)
+        return [servo] if servo is not None else []
+
+    def respond(self, servoid, cmd, data):
+        """
+        Send a response packet, after the wire time and latency.
+        """
+        if random.random() < self.drop_rate:
+            self.stats["dropped"] += 1
+            return
+        body = [len(data) + 7, servoid, cmd] + data
+        csm1 = hx.checksum1(body, len(body))
+        packet = bytearray([0xFF, 0xFF] + body[:3] + [csm1, hx.checksum2(csm1)] + data)
+        if random.random() < self.error_rate:
+            self.stats["corrupted"] += 1
+            packet[5] ^= 0x02
+        time.sleep(self.wire_time(len(packet)) + self.latency)
+        os.write(self.master, bytes(packet))
+        self.stats["responses"] += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate Herkulex servos on a pseudo-terminal.")
+    parser.add_argument("--ids", type=int, nargs="+", default=[3, 4], help="servo ids (default: 3 4)")
+    parser.add_argument("--model", type=int, default=0x06, help="servo model (default: 6, DRS-0602)")
+    parser.add_argument("--baudrate", type=int, default=115200, help="simulated baudrate (default: 115200)")
+    parser.add_argument("--latency", type=float, default=0.0, help="extra response latency in seconds (default: 0)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of dropping a response (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of corrupting a response (default: 0)")
+    args = parser.parse_args()
+
+    servos = [SimulatedServo(i, args.model) for i in args.ids]
+    bus = SimulatedBus(servos, args.baudrate, args.latency, args.drop_rate, args.error_rate)
+    bus.start()
+    print(f'simulating servos {args.ids} on {bus.port_name}')
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print(bus.stats)
+    finally:
+        bus.stop()
@@ -13,7 +13,6 @@ The onboard webpage also performs speech recognition, which is published to this
 
 
 import os
-import time
 import json
 from flask import Flask, send_from_directory, request, jsonify
 from flask_cors import CORS
@@ -190,8 +189,7 @@ if __name__ == "__main__":
     server_thread.start()
     node.loginfo("server running on port " + str(server_port))
     server.ready = True
-    while not node.is_shutdown():
-        time.sleep(0.1)
+    node.wait_shutdown()
     print("server shutting down")
 
 
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+
+
+"""
+
+Icons.
+
+Decodes the led matrix icons into frames of colors, and caches them.
+
+A frame is a uint8 numpy array of 169 rgb colors, in the order of the leds: row by row, with mirrored columns.
+
+Icons in the static icons folder are cached in memory by name and modification time, so an edited icon is decoded again.
+The cache is kept per process, the leds driver calls prewarm() at startup to decode all icons before they are needed.
+
+"""
+
+
+import functools
+import os
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+
+# side of the led matrix
+MATRIX_SIDE = 13
+# number of decoded icons kept in memory
+CACHE_SIZE = 32
+# icon file extensions
+EXTENSIONS = (".png", ".gif", ".jpg", ".jpeg", ".bmp")
+
+
+class Icon:
+    """
+    Icon class.
+    frames is a read only uint8 array, with shape (number of frames, 169, 3).
+    durations holds the duration of each frame, in seconds, 0 for still images.
+    """
+
+    def __init__(self, frames, durations):
+        self.frames = frames
+        self.durations = durations
+
+    def is_animated(self):
+        return len(self.frames) > 1
+
+
+def to_leds(image):
+    """
+    Get the frame of an image array, with shape (13, 13, 3), in the order of the leds.
+    """
+    return image[:MATRIX_SIDE, :MATRIX_SIDE][:, ::-1].reshape(-1, 3)
+
+
+def decode(image):
+    """
+    Decode all frames of an image.
+    """
+    frames = []
+    durations = []
+    for index in range(getattr(image, "n_frames", 1)):
+        image.seek(index)
+        frames.append(to_leds(np.asarray(image.convert("RGB"), dtype=np.uint8)))
+        durations.append(image.info.get("duration", 0) / 1000.0)
+    frames = np.stack(frames)
+    frames.flags.writeable = False
+    return Icon(frames, durations)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def load_file(path, mtime):
+    """
+    Decode an icon file, cached by path and modification time.
+    """
+    with Image.open(path) as image:
+        return decode(image)
+
+
+def load(name, icons_path):
+    """
+    Get a decoded icon from the icons folder.
+    """
+    path = os.path.join(icons_path, name)
+    return load_file(path, os.path.getmtime(path))
+
+
+def load_url(url):
+    """
+    Download and decode an icon, it is not cached.
+    """
+    response = requests.get(url)
+    with Image.open(BytesIO(response.content)) as image:
+        return decode(image)
+
+
+def prewarm(icons_path):
+    """
+    Decode all icons of the icons folder into the cache.
+    Returns the names of the decoded icons.
+    """
+    names = []
+    for root, dirs, files in os.walk(icons_path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS):
+                name = os.path.relpath(os.path.join(root, name), icons_path)
+                try:
+                    load(name, icons_path)
+                    names.append(name)
+                except Exception as e:
+                    print(f'could not decode icon {name}: {e}')
+    return names
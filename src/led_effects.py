@@ -0,0 +1,283 @@
+#! /usr/bin/env python
+
+
+"""
+
+Led effects.
+
+Procedural effects for the led matrix, rendered with numpy by driver_leds.
+
+An effect is described by a dictionary with its type and parameters, e.g. {"type": "breathe", "color": [255, 0, 0]}.
+Parameters that are not given keep their default value. Colors are [r, g, b] lists.
+
+Effects render images with shape (13, 13, 3), row by row from the top, columns from the left.
+Use icons.to_leds() to get the frame of an image.
+
+Effect types:
+
+- breathe: color fades in and out. color, period (s), min (0 ~ 1)
+- rainbow: moving rainbow. period (s), scale (rainbows across the matrix), brightness (0 ~ 1)
+- spinner: rotating arc. color, period (s), radius, width, tail (fraction of the circle)
+- meter: audio level meter, bars rise from the bottom. level (0 ~ 1, or a list of levels, one per bar),
+  color, peak_color, release (levels per second), peak_fall (levels per second)
+- text: scrolling text. text, color, speed (columns per second), loop
+- progress: progress bar. progress (0 ~ 1), color, background
+
+"""
+
+
+import numpy as np
+
+
+# side of the led matrix
+MATRIX_SIDE = 13
+# pixel coordinates, y from the top, x from the left
+Y, X = np.mgrid[0:MATRIX_SIDE, 0:MATRIX_SIDE].astype(float)
+CENTER = (MATRIX_SIDE - 1) / 2.0
+RADIUS = np.hypot(X - CENTER, Y - CENTER)
+ANGLE = np.arctan2(Y - CENTER, X - CENTER)
+
+# 5x7 bitmap font, one bitmask per row, the leftmost column is the highest bit
+FONT_WIDTH = 5
+FONT_HEIGHT = 7
+FONT = {
+    " ": (0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00),
+    "A": (0x0E, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    "B": (0x1E, 0x11, 0x11, 0x1E, 0x11, 0x11, 0x1E),
+    "C": (0x0E, 0x11, 0x10, 0x10, 0x10, 0x11, 0x0E),
+    "D": (0x1C, 0x12, 0x11, 0x11, 0x11, 0x12, 0x1C),
+    "E": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x1F),
+    "F": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x10),
+    "G": (0x0E, 0x11, 0x10, 0x17, 0x11, 0x11, 0x0F),
+    "H": (0x11, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    "I": (0x0E, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "J": (0x07, 0x02, 0x02, 0x02, 0x02, 0x12, 0x0C),
+    "K": (0x11, 0x12, 0x14, 0x18, 0x14, 0x12, 0x11),
+    "L": (0x10, 0x10, 0x10, 0x10, 0x10, 0x10, 0x1F),
+    "M": (0x11, 0x1B, 0x15, 0x15, 0x11, 0x11, 0x11),
+    "N": (0x11, 0x11, 0x19, 0x15, 0x13, 0x11, 0x11),
+    "O": (0x0E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "P": (0x1E, 0x11, 0x11, 0x1E, 0x10, 0x10, 0x10),
+    "Q": (0x0E, 0x11, 0x11, 0x11, 0x15, 0x12, 0x0D),
+    "R": (0x1E, 0x11, 0x11, 0x1E, 0x14, 0x12, 0x11),
+    "S": (0x0F, 0x10, 0x10, 0x0E, 0x01, 0x01, 0x1E),
+    "T": (0x1F, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04),
+    "U": (0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "V": (0x11, 0x11, 0x11, 0x11, 0x11, 0x0A, 0x04),
+    "W": (0x11, 0x11, 0x11, 0x15, 0x15, 0x15, 0x0A),
+    "X": (0x11, 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x11),
+    "Y": (0x11, 0x11, 0x0A, 0x04, 0x04, 0x04, 0x04),
+    "Z": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x10, 0x1F),
+    "0": (0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E),
+    "1": (0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "2": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F),
+    "3": (0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E),
+    "4": (0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02),
+    "5": (0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E),
+    "6": (0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E),
+    "7": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08),
+    "8": (0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E),
+    "9": (0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C),
+    "!": (0x04, 0x04, 0x04, 0x04, 0x04, 0x00, 0x04),
+    "?": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x00, 0x04),
+    ".": (0x00, 0x00, 0x00, 0x00, 0x00, 0x0C, 0x0C),
+    ",": (0x00, 0x00, 0x00, 0x00, 0x0C, 0x04, 0x08),
+    ":": (0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x0C, 0x00),
+    "'": (0x04, 0x04, 0x08, 0x00, 0x00, 0x00, 0x00),
+    "-": (0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00),
+    "+": (0x00, 0x04, 0x04, 0x1F, 0x04, 0x04, 0x00),
+    "=": (0x00, 0x00, 0x1F, 0x00, 0x1F, 0x00, 0x00),
+    "/": (0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x00),
+    "%": (0x18, 0x19, 0x02, 0x04, 0x08, 0x13, 0x03),
+    "(": (0x02, 0x04, 0x08, 0x08, 0x08, 0x04, 0x02),
+    ")": (0x08, 0x04, 0x02, 0x02, 0x02, 0x04, 0x08),
+}
+
+
+def glyph(char):
+    """
+    Get the bitmap of a character, with shape (7, 5).
+    Lowercase letters use the uppercase glyphs, unknown characters are shown as ?.
+    """
+    rows = FONT.get(char.upper(), FONT["?"])
+    return (np.array(rows)[:, None] >> np.arange(FONT_WIDTH - 1, -1, -1)) & 1
+
+
+def render_text(text):
+    """
+    Get the bitmap of a text, with shape (7, width), characters are separated by a blank column.
+    """
+    columns = [np.zeros((FONT_HEIGHT, 0), dtype=int)]
+    for char in text:
+        columns.append(glyph(char))
+        columns.append(np.zeros((FONT_HEIGHT, 1), dtype=int))
+    return np.concatenate(columns, axis=1)
+
+
+def fill(color, intensity=1.0):
+    """
+    Get an image of a color, scaled by intensity, a number or an array with shape (13, 13).
+    """
+    return np.asarray(intensity, dtype=float)[..., None] * np.asarray(color, dtype=float) * np.ones((MATRIX_SIDE, MATRIX_SIDE, 1))
+
+
+class Effect:
+    """
+    Effect class.
+    Extend this class to define new effects.
+    The params attribute defines the parameters of the effect, and their default values.
+    The positive attribute lists the periods and rates, which must be greater than 0.
+    Parameters are set as attributes, update() changes them without restarting the effect.
+    """
+
+    params = {}
+    positive = ()
+
+    def __init__(self, **params):
+        for name, default in self.params.items():
+            setattr(self, name, default)
+        self.update(params)
+
+    def update(self, params):
+        """
+        Change parameters, raises ValueError and keeps the current ones if a period or rate is not greater than 0.
+        """
+        for name in self.positive:
+            if name in params:
+                try:
+                    valid = float(params[name]) > 0
+                except (TypeError, ValueError):
+                    valid = False
+                if not valid:
+                    raise ValueError(f'{name} must be greater than 0, got {params[name]}')
+        for name in self.params:
+            if name in params:
+                setattr(self, name, params[name])
+
+    def render(self, t):
+        """
+        Render the image at t seconds from the start of the effect.
+        """
+        raise NotImplementedError
+
+
+class Breathe(Effect):
+    params = {"color": [255, 255, 255], "period": 4.0, "min": 0.0}
+    positive = ("period",)
+
+    def render(self, t):
+        level = 0.5 - 0.5 * np.cos(2 * np.pi * t / self.period)
+        return fill(self.color, self.min + (1.0 - self.min) * level)
+
+
+class Rainbow(Effect):
+    params = {"period": 5.0, "scale": 1.0, "brightness": 1.0}
+    positive = ("period",)
+
+    def render(self, t):
+        hue = ((X + Y) / (2 * MATRIX_SIDE) * self.scale - t / self.period) % 1.0
+        # hsv to rgb, with full saturation and value
+        rgb = np.clip(np.abs((hue[..., None] * 6 + [0, 4, 2]) % 6 - 3) - 1, 0, 1)
+        return rgb * 255 * self.brightness
+
+
+class Spinner(Effect):
+    params = {"color": [255, 255, 255], "period": 1.0, "radius": 5.0, "width": 1.5, "tail": 0.75}
+    positive = ("period", "tail")
+
+    def render(self, t):
+        # fraction of the circle behind the head of the arc
+        behind = ((2 * np.pi * t / self.period - ANGLE) % (2 * np.pi)) / (2 * np.pi)
+        intensity = np.clip(1.0 - behind / self.tail, 0, 1)
+        intensity[np.abs(RADIUS - self.radius) > self.width / 2] = 0
+        return fill(self.color, intensity)
+
+
+class Meter(Effect):
+    params = {
+        "level": 0.0,
+        "color": [0, 255, 0],
+        "peak_color": [255, 0, 0],
+        "release": 1.5,
+        "peak_fall": 0.5,
+    }
+    positive = ("release", "peak_fall")
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.last = None
+        self.shown = np.zeros(MATRIX_SIDE)
+        self.peaks = np.zeros(MATRIX_SIDE)
+
+    def render(self, t):
+        dt = 0.0 if self.last is None else max(0.0, t - self.last)
+        self.last = t
+        levels = np.atleast_1d(np.asarray(self.level, dtype=float))
+        if len(levels) > 1:
+            levels = np.interp(np.linspace(0, len(levels) - 1, MATRIX_SIDE), np.arange(len(levels)), levels)
+        target = np.clip(levels, 0, 1) * np.ones(MATRIX_SIDE)
+        # rise at once, fall at the release rate, peaks fall slower
+        self.shown = np.maximum(target, self.shown - self.release * dt)
+        self.peaks = np.maximum(self.shown, self.peaks - self.peak_fall * dt)
+        height = self.shown * MATRIX_SIDE
+        rows = MATRIX_SIDE - 1 - Y
+        intensity = np.clip(height - rows, 0, 1)
+        # bars are green at the bottom and red at the top
+        mix = (rows / (MATRIX_SIDE - 1))[..., None]
+        image = ((1 - mix) * np.asarray(self.color, dtype=float) + mix * np.asarray(self.peak_color, dtype=float)) * intensity[..., None]
+        peak_rows = np.minimum(MATRIX_SIDE - 1, (self.peaks * MATRIX_SIDE).astype(int))
+        peak = (rows == peak_rows) & (self.peaks > 0)
+        image[peak] = self.peak_color
+        return image
+
+
+class Text(Effect):
+    params = {"text": "", "color": [255, 255, 255], "speed": 8.0, "loop": True}
+    positive = ("speed",)
+
+    def update(self, params):
+        super().update(params)
+        # the text enters from the right and leaves by the left
+        bitmap = render_text(str(self.text))
+        blank = np.zeros((FONT_HEIGHT, MATRIX_SIDE), dtype=int)
+        self.bitmap = np.concatenate((blank, bitmap, blank), axis=1)
+
+    def render(self, t):
+        steps = self.bitmap.shape[1] - MATRIX_SIDE
+        offset = int(t * self.speed)
+        offset = offset % max(1, steps) if self.loop else min(offset, steps)
+        intensity = np.zeros((MATRIX_SIDE, MATRIX_SIDE))
+        top = (MATRIX_SIDE - FONT_HEIGHT) // 2
+        intensity[top:top + FONT_HEIGHT] = self.bitmap[:, offset:offset + MATRIX_SIDE]
+        return fill(self.color, intensity)
+
+
+class Progress(Effect):
+    params = {"progress": 0.0, "color": [0, 128, 255], "background": [16, 16, 16]}
+
+    def render(self, t):
+        filled = np.clip(np.clip(self.progress, 0, 1) * MATRIX_SIDE - X, 0, 1)
+        bar = (Y >= CENTER - 1) & (Y <= CENTER + 1)
+        image = fill(self.background, bar) + (fill(self.color) - fill(self.background)) * (filled * bar)[..., None]
+        return image
+
+
+EFFECTS = {
+    "breathe": Breathe,
+    "rainbow": Rainbow,
+    "spinner": Spinner,
+    "meter": Meter,
+    "text": Text,
+    "progress": Progress,
+}
+
+
+def create(params):
+    """
+    Create the effect described by a dictionary.
+    Raises ValueError if the type is unknown, or a period or rate is not greater than 0.
+    """
+    cls = EFFECTS.get(params.get("type"))
+    if cls is None:
+        raise ValueError(f'unknown effect type: {params.get("type")}')
+    return cls(**params)
@@ -17,6 +17,9 @@ Additionally, the module defines several tools to manage node processes.
 
 Clients can use the Node class to signal that they are running, and check for shutdown events.
 
+Clients can watch keys for changes, instead of polling them.
+Changes are delivered by redis keyspace notifications, through a single background thread per process.
+
 The NodeManager class can be used to list, shutdown or kill all nodes.
 
 When used as a script, the module provides a command line interface to manage nodes.
@@ -27,13 +30,13 @@ When used as a script, the module provides a command line interface to manage no
 import redis
 import json
 import os
+import re
 import signal
+import struct
 import psutil
 import time
 import sys
 import requests
-from io import BytesIO
-from PIL import Image
 import threading
 
 
@@ -46,19 +49,80 @@ def get_connection():
 
 # global connection
 connection = get_connection()
+# number of keys per SCAN iteration
+SCAN_COUNT = 100
+# set with the names of the running nodes
+NODES_KEY = "nodes"
+# nodes refresh their heartbeat key every period, the key expires after the ttl, in seconds
+HEARTBEAT_PERIOD = 1.0
+HEARTBEAT_TTL = 3.0
+# a node whose main loop did not run for this long is stalled, in seconds
+STALL_TIMEOUT = 10.0
+# per thread state
+local = threading.local()
+
+
+class JsonCodec:
+    """
+    Codec class.
+    Encodes values to the bytes stored in the database, and decodes them back.
+    The default codec stores values as json.
+    """
+
+    def encode(self, value):
+        return json.dumps(value)
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+class RgbCodec(JsonCodec):
+    """
+    Codec for lists of rgb colors.
+    Stores 3 raw bytes per color, components are clamped to 0 ~ 255.
+    Decodes to a list of [r, g, b] lists.
+    """
+
+    def encode(self, value):
+        if getattr(value, "dtype", None) == "uint8":
+            # numpy arrays of colors, already in range
+            return value[..., :3].tobytes()
+        return bytes(max(0, min(255, int(c))) for color in value for c in color[:3])
+
+    def decode(self, raw):
+        return [list(raw[i:i + 3]) for i in range(0, len(raw), 3)]
+
 
+JSON = JsonCodec()
+RGB = RgbCodec()
+
+# codecs of the DBEntry fields that do not use json, by key
+key_codecs = {}
+
+
+def codec_for(key):
+    """
+    Get the codec used to store a key.
+    """
+    return key_codecs.get(key, JSON)
 
 def set_key(key, value):
     """
     Set a key in the redis database.
+    Inside a batch, the write is delayed until the batch is committed.
     """
-    connection.set(key, json.dumps(value))
+    raw = codec_for(key).encode(value)
+    current = getattr(local, "batch", None)
+    if current is not None:
+        current.values[key] = raw
+    else:
+        connection.set(key, raw)
 
 def get_key(key):
     """
     Get a key from the redis database.
     """
-    return json.loads(connection.get(key))
+    return codec_for(key).decode(connection.get(key))
 
 def has_key(key):
     """
@@ -66,11 +130,20 @@ def has_key(key):
     """
     return connection.exists(key) != 0
 
+def scan_keys(*patterns):
+    """
+    Iterate over the keys matching any of the patterns, or all keys.
+    Uses SCAN, so the database is not blocked while the keyspace is traversed.
+    """
+    for pattern in (patterns or ("*",)):
+        for k in connection.scan_iter(match=pattern, count=SCAN_COUNT):
+            yield k.decode()
+
 def has_any_key(prefix):
     """
     Check if any key with the given prefix exists in the redis database.
     """
-    return len(connection.keys(prefix + "*")) > 0
+    return has_any(prefix + "*")
 
 def delete_all():
     """
@@ -78,29 +151,238 @@ def delete_all():
     """
     connection.flushall()
 
-def get_all(*prefixes):
+def get_all(*prefixes, keys=None):
     """
     Get all keys from the redis database.
-    Optionally, filter by prefix.
+    Optionally, filter by prefix, or pass the list of keys to print.
+    Values are read with a single MGET, keys that do not hold values are skipped.
     """
-    for k in sorted(connection.keys()):
-        if len(prefixes) == 0 or any([k.decode().startswith(p) for p in prefixes]):
-            print(f'{k.decode()}:\t{get_key(k.decode())}')
+    if keys is None:
+        keys = sorted(set(scan_keys(*[p + "*" for p in prefixes])))
+    values = connection.mget(keys) if len(keys) > 0 else []
+    for k, raw in zip(keys, values):
+        if raw is not None:
+            print(f'{k}:\t{codec_for(k).decode(raw)}')
 
 def has_any(key):
     """
-    Check if any key with the given prefix exists in the redis database.
+    Check if any key matching the pattern exists in the redis database.
     """
-    return len(connection.keys(key)) > 0
+    for _ in scan_keys(key):
+        return True
+    return False
+
+
+# keyspace notifications: K (keyspace channel), $ (string commands), g (del, expire, ...)
+KEYSPACE_EVENTS = "K$g"
+# how often the watcher thread checks for new subscriptions, in seconds
+WATCH_PERIOD = 0.1
+# how long the watcher thread waits before reconnecting, in seconds
+RECONNECT_PERIOD = 1.0
+
+
+def keyspace_channel(key):
+    """
+    Get the keyspace notification channel of a key.
+    """
+    db = connection.connection_pool.connection_kwargs.get("db", 0)
+    return f'__keyspace@{db}__:{key}'
+
+
+class Watcher:
+    """
+    Watcher class.
+    Listens to redis keyspace notifications in a background thread.
+    Calls the callbacks registered for a key, with the key as argument, every time the key changes.
+    Callbacks run in the watcher thread, so they should return quickly.
+    A single watcher is shared by the whole process, use watch() and unwatch().
+
+    When the connection to redis is lost, the watcher reconnects, enables the notifications again, since a restarted
+    redis forgets them, and calls the callbacks of every watched key, as changes may have been missed meanwhile.
+    This also drops the values of cached DBEntry instances.
+    """
+
+    def __init__(self):
+        self.callbacks = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, keys, callback):
+        """
+        Register a callback for several keys.
+        Returns once the keys are subscribed, so no later change is missed.
+        """
+        subscribed = threading.Event()
+        with self.lock:
+            new_keys = [k for k in keys if k not in self.callbacks]
+            for key in keys:
+                self.callbacks.setdefault(key, []).append(callback)
+            if len(new_keys) > 0:
+                self.pending.append(("subscribe", new_keys, subscribed))
+            else:
+                subscribed.set()
+            if self.thread is None:
+                connection.config_set("notify-keyspace-events", KEYSPACE_EVENTS)
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        if threading.current_thread() is not self.thread:
+            subscribed.wait(1.0)
+
+    def unwatch(self, key, callback):
+        """
+        Remove a callback registered for a key.
+        """
+        with self.lock:
+            callbacks = self.callbacks.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if key in self.callbacks and len(callbacks) == 0:
+                del self.callbacks[key]
+                self.pending.append(("unsubscribe", [key], threading.Event()))
+
+    def dispatch(self, key):
+        with self.lock:
+            callbacks = list(self.callbacks.get(key, []))
+        for callback in callbacks:
+            try:
+                callback(key)
+            except Exception as e:
+                print(f'watcher: error in callback for {key}: {e}')
+
+    def run(self):
+        """
+        Main loop of the watcher thread.
+        """
+        pubsub = connection.pubsub(ignore_subscribe_messages=True)
+        prefix = keyspace_channel("")
+        reconnected = False
+        while True:
+            try:
+                with self.lock:
+                    pending, self.pending = self.pending, []
+                for op, keys, done in pending:
+                    if len(keys) > 0:
+                        getattr(pubsub, op)(*[keyspace_channel(k) for k in keys])
+                    done.set()
+                if reconnected:
+                    connection.config_set("notify-keyspace-events", KEYSPACE_EVENTS)
+                    reconnected = False
+                    with self.lock:
+                        keys = list(self.callbacks)
+                    for key in keys:
+                        self.dispatch(key)
+                if not pubsub.subscribed:
+                    time.sleep(WATCH_PERIOD)
+                    continue
+                message = pubsub.get_message(timeout=WATCH_PERIOD)
+                if message is None or message["type"] != "message":
+                    continue
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                self.dispatch(channel[len(prefix):])
+            except redis.ConnectionError:
+                # resubscribe everything once redis is back
+                time.sleep(RECONNECT_PERIOD)
+                pubsub = connection.pubsub(ignore_subscribe_messages=True)
+                with self.lock:
+                    self.pending = [("subscribe", list(self.callbacks), threading.Event())]
+                reconnected = True
+
+
+# global watcher
+watcher = Watcher()
+
+
+def watch(key, callback):
+    """
+    Call callback(key) every time a key in the redis database changes.
+    """
+    watcher.watch([key], callback)
+
+def unwatch(key, callback):
+    """
+    Stop calling callback when a key in the redis database changes.
+    """
+    watcher.unwatch(key, callback)
+
+def wait_for_change(keys, timeout=None):
+    """
+    Block until any of the keys changes, or the timeout (in seconds) expires.
+    Returns True if a key changed, False on timeout.
+    Changes that happen before the call are not seen, use the Changes class in loops.
+    """
+    changes = Changes(*keys)
+    changes.event.clear()
+    try:
+        return changes.wait(timeout)
+    finally:
+        changes.close()
+
+
+class Changes:
+    """
+    Changes class.
+    Collects change notifications for a set of keys.
+    Use wait() to block until any of the keys changes, instead of polling them.
+    Changes that happen between calls to wait() are not lost.
+    Use pop() after wait() to get which keys changed, instead of waiting on several instances.
+    The first call to wait() returns immediately, with all keys changed, so the current state can be processed.
+    Use close() to stop watching the keys.
+    """
+
+    def __init__(self, *keys):
+        self.keys = keys
+        self.lock = threading.Lock()
+        self.changed = set(keys)
+        self.event = threading.Event()
+        self.event.set()
+        watcher.watch(self.keys, self.notify)
+
+    def notify(self, key):
+        with self.lock:
+            self.changed.add(key)
+        self.event.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for a change, or for the timeout (in seconds) to expire.
+        Returns True if a key changed, False on timeout.
+        """
+        changed = self.event.wait(timeout)
+        self.event.clear()
+        return changed
+
+    def pop(self):
+        """
+        Get the keys that changed since the last call, and forget them.
+        """
+        with self.lock:
+            changed, self.changed = self.changed, set()
+        return changed
+
+    def close(self):
+        for key in self.keys:
+            unwatch(key, self.notify)
 
 
 class Node:
     """
     Node class.
     Initialize this class to signal node is running.
-    Use is_shutdown() to check if node should shutdown.
+    Use is_shutdown() to check if node should shutdown, or wait_shutdown() to block until it should.
     Use shutdown() to signal node is shutting down.
+    Use changes() to wait for changes to keys, that also wakes up on shutdown.
     Use loginfo(), logwarn() and logerror() to log messages.
+
+    A background thread refreshes a heartbeat key, which expires if the process dies.
+    The heartbeat reports the loop rate and lag of the node.
+    Each call to is_shutdown() counts as a loop iteration, loops that do not call it can call tick().
+
+    The shutdown flag is kept in memory, is_shutdown() does not access the database.
+    The watcher thread updates it when the flag changes in the database.
+    The heartbeat thread also checks the flag, in case a notification is lost.
     """
 
     INFO = 0
@@ -111,8 +393,55 @@ class Node:
         self.name = name
         set_key("node_" + name, os.getpid())
         set_key(name + "_is_shutdown", False)
+        connection.sadd(NODES_KEY, name)
         print(f'{name}: running')
         self.log_level = log_level
+        self.loops = 0
+        self.last_loop = time.monotonic()
+        self.shutdown_event = threading.Event()
+        watch(name + "_is_shutdown", self.check_shutdown)
+        self.check_shutdown()
+        self.stopped = threading.Event()
+        self.heartbeat_thread = threading.Thread(target=self.heartbeat, daemon=True)
+        self.heartbeat_thread.start()
+
+    def check_shutdown(self, key=None):
+        """
+        Read the shutdown flag from the database, set the shutdown event if it is set.
+        """
+        raw = connection.get(self.name + "_is_shutdown")
+        if raw is not None and json.loads(raw):
+            self.shutdown_event.set()
+
+    def tick(self):
+        """
+        Signal that the main loop ran once.
+        """
+        self.loops += 1
+        self.last_loop = time.monotonic()
+
+    def heartbeat(self):
+        """
+        Heartbeat thread.
+        Refreshes the heartbeat key with the loop rate and lag, until the node shuts down.
+        """
+        last_beat, last_loops = time.monotonic(), self.loops
+        while True:
+            now, loops = time.monotonic(), self.loops
+            beat = {
+                "pid": os.getpid(),
+                "time": time.time(),
+                "loop_rate": (loops - last_loops) / max(now - last_beat, 1e-3),
+                "lag": now - self.last_loop,
+            }
+            last_beat, last_loops = now, loops
+            try:
+                connection.set("heartbeat_" + self.name, json.dumps(beat), px=int(HEARTBEAT_TTL * 1000))
+                self.check_shutdown()
+            except redis.ConnectionError:
+                pass
+            if self.stopped.wait(HEARTBEAT_PERIOD):
+                break
 
     def loginfo(self, message):
         if self.log_level <= Node.INFO:
@@ -129,12 +458,40 @@ class Node:
     def set_log_level(self, level):
         self.log_level = level
 
-    def is_shutdown(self):
-        return get_key(self.name + "_is_shutdown")
+    def is_shutdown(self, tick=True):
+        """
+        Check if the node should shutdown.
+        Helper threads pass tick=False, so only the main loop counts for the heartbeat.
+        """
+        if tick:
+            self.tick()
+        return self.shutdown_event.is_set()
+
+    def wait_shutdown(self, timeout=None, tick=True):
+        """
+        Block until the node should shutdown, or the timeout (in seconds) expires.
+        Returns True if the node should shutdown.
+        Waiting counts as running the main loop, for the heartbeat, unless tick is False.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_shutdown(tick):
+            period = HEARTBEAT_PERIOD if deadline is None else min(HEARTBEAT_PERIOD, deadline - time.monotonic())
+            if period <= 0 or self.shutdown_event.wait(period):
+                break
+        return self.shutdown_event.is_set()
+
+    def changes(self, *keys):
+        """
+        Get a Changes instance for the given keys and the node's shutdown flag.
+        """
+        return Changes(self.name + "_is_shutdown", *keys)
 
     def shutdown(self):
-        connection.delete("node_" + self.name)
-        connection.delete(self.name + "_is_shutdown")
+        unwatch(self.name + "_is_shutdown", self.check_shutdown)
+        self.stopped.set()
+        self.heartbeat_thread.join()
+        connection.srem(NODES_KEY, self.name)
+        connection.delete("node_" + self.name, self.name + "_is_shutdown", "heartbeat_" + self.name)
         print(f'{self.name}: shutdown')
 
 
@@ -143,11 +500,13 @@ class NodeManager:
     """
     NodeManager class.
     Use this class to list, shutdown or kill all nodes.
-    Nodes that hang can be force shutdown.
+    Nodes that hang can be force shutdown, unless they share their process with other nodes.
+    Running nodes are registered in a set, so listing them does not scan the database.
+    Liveness is based on the heartbeat of the nodes, use status() to get their last seen time, loop rate and lag.
     """
 
     def list_nodes(self):
-        return [k.decode()[5:] for k in connection.keys("node_*")]
+        return [k.decode() for k in connection.smembers(NODES_KEY)]
     
     def get_pid(self, name):
         return get_key("node_" + name)
@@ -156,22 +515,69 @@ class NodeManager:
         pid = self.get_pid(name)
         return psutil.pid_exists(pid)
 
+    def get_heartbeat(self, name):
+        """
+        Get the last heartbeat of a node, or None if it expired.
+        """
+        raw = connection.get("heartbeat_" + name)
+        return None if raw is None else json.loads(raw)
+
+    def status(self, name):
+        """
+        Get the status of a node.
+        Reports if the node is alive and stalled, how many seconds ago it was last seen, its loop rate and lag.
+        """
+        beat = self.get_heartbeat(name)
+        if beat is None:
+            return {"alive": False, "stalled": False, "last_seen": None, "loop_rate": None, "lag": None}
+        last_seen = max(0.0, time.time() - beat["time"])
+        lag = beat["lag"] + last_seen
+        return {
+            "alive": True,
+            "stalled": lag > STALL_TIMEOUT,
+            "last_seen": last_seen,
+            "loop_rate": beat["loop_rate"],
+            "lag": lag,
+        }
+
     def is_alive(self, name):
-        return name in self.list_nodes() and self.is_running(name)
+        return bool(connection.sismember(NODES_KEY, name)) and self.get_heartbeat(name) is not None
+
+    def is_stalled(self, name):
+        """
+        Check if a node is alive, but its main loop did not run for longer than STALL_TIMEOUT.
+        """
+        return self.status(name)["stalled"]
 
     def shutdown(self, name):
         if self.is_alive(name):
             set_key(name + "_is_shutdown", True)
     
+    def shares_process(self, name):
+        """
+        Get the other nodes that run in the process of a node, e.g. nodes hosted by nodehost.
+        """
+        pid = self.get_pid(name)
+        return [other for other in self.list_nodes() if other != name and self.get_pid(other) == pid]
+
     def force_shutdown(self, name):
-        if name in self.list_nodes():
+        """
+        Kill the process of a node.
+        A node that shares its process with other nodes is not killed, it is only signaled to shutdown.
+        """
+        if connection.sismember(NODES_KEY, name):
+            shared = self.shares_process(name)
+            if shared:
+                print(f'{name} shares its process with {", ".join(sorted(shared))}, signaling it to shutdown instead')
+                set_key(name + "_is_shutdown", True)
+                return
             if self.is_running(name):
                 pid = self.get_pid(name)
                 os.kill(pid, signal.SIGKILL)
                 time.sleep(1.0)
             if not self.is_running(name):
-                connection.delete("node_" + name)
-                connection.delete(name + "_is_shutdown")
+                connection.srem(NODES_KEY, name)
+                connection.delete("node_" + name, name + "_is_shutdown", "heartbeat_" + name)
 
 
 class DBEntry:
@@ -181,27 +587,250 @@ class DBEntry:
     Extend this class to define data that will be stored in the database.
     The fields attribute defines the data that will be stored.
     The prefix attribute defines the prefix that will be used to store the data.
+    Use watch() to be notified when a field changes.
+    Use changes() to wait for changes to fields.
+    Use snapshot() to read several fields, and batch() to write several fields, with a single request.
+
+    The codecs attribute defines how fields are stored, fields not listed are stored as json.
+
+    Set cache to True to serve reads from a per-instance cache.
+    Cached fields are invalidated by keyspace notifications when they change in the database.
+    Set max_age to bound how stale a cached value can be, in seconds.
+    max_age can be a number for all fields, or a dictionary with a value per field.
+    Use close() to stop watching the fields, when a cached instance or watch() callbacks are no longer needed.
     """
 
     prefix = ''
     fields = {}
-    def __init__(self):
+    codecs = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for field, codec in cls.codecs.items():
+            key_codecs[f'{cls.prefix}_{field}'] = codec
+
+    def __init__(self, cache=False, max_age=None):
+        self.watchers = {}
+        self.cache = cache
+        self.max_age = max_age
+        self.cached = {}
+        self.generations = {}
         for k in self.fields:
             setattr(self.__class__, k, property(self.getter(k), self.setter(k)))
+        if self.cache:
+            watcher.watch([self.key(k) for k in self.fields], self.invalidate_key)
+
+    def key(self, field):
+        """
+        Get the database key of a field.
+        """
+        return f'{self.prefix}_{field}'
+
+    def close(self):
+        """
+        Remove the callbacks of the cache and of watch(), the cache is dropped.
+        """
+        for field, callback in list(self.watchers):
+            self.unwatch(field, callback)
+        if self.cache:
+            for k in self.fields:
+                unwatch(self.key(k), self.invalidate_key)
+            self.cache = False
+            self.cached = {}
+
+    def watch(self, field, callback):
+        """
+        Call callback(value) with the new value of a field, every time it changes.
+        """
+        def on_change(key):
+            callback(getattr(self, field))
+        self.watchers[(field, callback)] = on_change
+        watch(self.key(field), on_change)
+
+    def unwatch(self, field, callback):
+        """
+        Stop calling callback when a field changes.
+        """
+        on_change = self.watchers.pop((field, callback), None)
+        if on_change is not None:
+            unwatch(self.key(field), on_change)
+
+    def changes(self, *fields):
+        """
+        Get a Changes instance for the given fields.
+        """
+        return Changes(*[self.key(f) for f in fields])
     
+    def invalidate(self, field=None):
+        """
+        Drop a field from the cache, or all fields if none is given.
+        """
+        for f in ([field] if field is not None else list(self.fields)):
+            self.generations[f] = self.generations.get(f, 0) + 1
+            self.cached.pop(f, None)
+
+    def invalidate_key(self, key):
+        self.invalidate(key[len(self.prefix) + 1:])
+
+    def get_max_age(self, field):
+        if isinstance(self.max_age, dict):
+            return self.max_age.get(field)
+        return self.max_age
+
+    def lookup(self, field):
+        """
+        Get the raw value of a field from the cache.
+        Returns None if the field is not cached, or is too old.
+        """
+        entry = self.cached.get(field)
+        if entry is None:
+            return None
+        raw, timestamp = entry
+        max_age = self.get_max_age(field)
+        if max_age is not None and time.monotonic() - timestamp > max_age:
+            return None
+        return raw
+
+    def store(self, field, raw, generation, timestamp):
+        """
+        Store the raw value of a field in the cache.
+        The value is dropped if the field was invalidated while it was being read.
+        """
+        if raw is not None and self.generations.get(field, 0) == generation:
+            self.cached[field] = (raw, timestamp)
+
+    def read(self, field):
+        """
+        Read the raw value of a field, from the cache if possible.
+        """
+        if not self.cache:
+            return connection.get(self.key(field))
+        raw = self.lookup(field)
+        if raw is not None:
+            return raw
+        generation = self.generations.get(field, 0)
+        timestamp = time.monotonic()
+        raw = connection.get(self.key(field))
+        self.store(field, raw, generation, timestamp)
+        return raw
+
+    def decode(self, field, raw):
+        """
+        Decode the raw value of a field.
+        Missing fields are initialized with their default value.
+        """
+        codec = codec_for(self.key(field))
+        if raw is None:
+            raw = codec.encode(self.fields[field])
+            connection.set(self.key(field), raw, nx=True)
+        return codec.decode(raw)
+
+    def snapshot(self, *fields):
+        """
+        Read several fields with a single request.
+        Returns a dictionary with the value of each field, or of all fields if none is given.
+        """
+        return snapshot((self, fields or list(self.fields)))[0]
+
+    def take(self, field):
+        """
+        Read a field and reset it to its default value, with a single request.
+        Use it for command fields, so a command written between the read and the reset is not lost.
+        """
+        key = self.key(field)
+        codec = codec_for(key)
+        raw = connection.getset(key, codec.encode(self.fields[field]))
+        if self.cache:
+            self.invalidate(field)
+        return codec.decode(raw) if raw is not None else self.fields[field]
+
+    def batch(self):
+        """
+        Group writes into a single request, use it as a context manager.
+        See the Batch class.
+        """
+        return batch()
+
     def getter(self, key):
         def do_get(self):
-            if not has_key(f'{self.prefix}_{key}'):
-                set_key(f'{self.prefix}_{key}', self.fields[key])
-            return get_key(f'{self.prefix}_{key}')
+            return self.decode(key, self.read(key))
         return do_get
     
     def setter(self, key):
         def do_set(self, value):
-            set_key(f'{self.prefix}_{key}', value)
+            set_key(self.key(key), value)
+            if self.cache:
+                self.invalidate(key)
         return do_set
 
 
+def snapshot(*requests):
+    """
+    Read fields of several DBEntry instances with a single MGET.
+    Each request is a tuple (entry, fields).
+    Returns a list with a dictionary of values per request.
+    Cached fields are served from the cache.
+    """
+    raws = [{} for _ in requests]
+    missing = []
+    for i, (entry, fields) in enumerate(requests):
+        for field in fields:
+            raw = entry.lookup(field) if entry.cache else None
+            if raw is not None:
+                raws[i][field] = raw
+            else:
+                missing.append((i, entry, field, entry.generations.get(field, 0)))
+    if len(missing) > 0:
+        timestamp = time.monotonic()
+        values = connection.mget([entry.key(field) for _, entry, field, _ in missing])
+        for (i, entry, field, generation), raw in zip(missing, values):
+            if entry.cache:
+                entry.store(field, raw, generation, timestamp)
+            raws[i][field] = raw
+    return [
+        {field: entry.decode(field, raws[i][field]) for field in fields}
+        for i, (entry, fields) in enumerate(requests)
+    ]
+
+
+class Batch:
+    """
+    Batch class.
+    Collects the writes made by the current thread, to any DBEntry, and commits them with a single MSET.
+    Use it as a context manager, through batch().
+    Nested batches are merged into the outermost one.
+    Reads inside the batch do not see the pending writes.
+    If an exception is raised inside the batch, the writes are discarded.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.outer = None
+
+    def __enter__(self):
+        self.outer = getattr(local, "batch", None)
+        if self.outer is None:
+            local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.outer is not None:
+            # nested batch, writes already went to the outer batch
+            return False
+        local.batch = None
+        if exc_type is None and len(self.values) > 0:
+            connection.mset(self.values)
+        return False
+
+
+def batch():
+    """
+    Group writes into a single request.
+    Usage: with batch(): ...
+    """
+    return Batch()
+
+
 class Robot(DBEntry):
     """
     Database entry.
@@ -266,58 +895,92 @@ class Leds(DBEntry):
     LED information.
     Set colors to a list of 3-element tuples to set the colors.
     The led matrix has 169 leds, arranged in a 13x13 grid.
-    Set brightness to a value between 0.0 and 1.0 to set the brightness.
+    Colors are stored as 3 raw bytes per led.
+    Use load_from_url to show an icon, icons served from the static folder are decoded once and cached, see icons.py.
+    Set animation to {"name": <icon>, "loop": <bool or count>, "fps": <fps>, "queue": <bool>} to play an animated icon.
+    The driver plays it from memory, use "url" instead of "name" for icons that are not in the static folder.
+    "loop", "fps" and "queue" are optional: play once, at the icon's frame durations, replacing the current animation.
+    Queued animations play after the current one. An animation without name or url, or setting colors, cancels all.
+    Set effect to {"type": <type>, <parameter>: <value>, ...} to render a procedural effect, see led_effects.py.
+    Setting an effect of the same type updates its parameters, set it to None to stop it.
+    Check playing to see the name or url of the animation being played, or the type of the effect.
+    Set brightness to a value between 0.0 and 1.0 to set the brightness, the driver applies it at once.
+    Set gamma to correct the led response, 1.0 is linear, about 2.2 makes fades look smoother.
+    Set color_balance to a factor per component, between 0.0 and 1.0, to calibrate the white point.
     """
     prefix = "leds"
     fields = {
         'ready': False,
         'number': 169,
         'colors': [[0, 0, 0]] * 169,
-        'brightness': 0.3
+        'animation': None,
+        'effect': None,
+        'playing': None,
+        'brightness': 0.3,
+        'gamma': 1.0,
+        'color_balance': [1.0, 1.0, 1.0]
+    }
+    codecs = {
+        'colors': RGB,
     }
 
+    def load_icon(self, url):
+        """
+        Get the decoded icon of an url.
+        Icons of the static folder are read from the icons cache, others are downloaded.
+        """
+        # imported here, so nodes that do not show icons do not load numpy and PIL
+        import icons
+        icons_url = Server().url_for_icon("")
+        if url.startswith(icons_url):
+            name = url[len(icons_url):]
+            icons_path = self.icons_path()
+            if os.path.isfile(os.path.join(icons_path, name)):
+                return icons.load(name, icons_path)
+        return icons.load_url(url)
+
+    def icons_path(self):
+        """
+        Get the path of the icons folder, a relative static path is relative to the folder of this module.
+        """
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), Server().static_path, "icons")
+
+    def prewarm_icons(self):
+        """
+        Decode all icons of the static folder into the icons cache of this process, so the first load is fast.
+        """
+        import icons
+        return icons.prewarm(self.icons_path())
+
+    def play(self, name=None, url=None, loop=False, fps=None, queue=False):
+        """
+        Play an animated icon, by name or url, see the animation field.
+        """
+        animation = {"loop": loop, "fps": fps, "queue": queue}
+        if name is not None:
+            animation["name"] = name
+        if url is not None:
+            animation["url"] = url
+        self.animation = animation
+
+    def stop(self):
+        """
+        Stop the animation being played, and clear the queue.
+        """
+        self.animation = {}
+
     def load_from_url(self, url):
-        # gif
-        if ".gif" in url:
-            response = requests.get(url)
-            img = BytesIO(response.content)
-            image = Image.open(img)
-            # create image buffer
-            frames = []
-            try:
-                while 1:
-                    image.seek(image.tell() + 1)
-                    colors = []
-                    for row in range(13):
-                        for col in range(13):
-                            im = image.convert("RGB")
-                            color = im.getpixel((12 - col, row))[0:3]
-                            colors.append(color)
-                    frames.append(colors)
-            except EOFError:
-                final_color = [[0, 0, 0]] * self.number
-                frames.append(final_color)
-            # schedule the publishing of the messages
-            time_between_frames = image.info["duration"] / 1000.0
-            for i in range(len(frames)):
-                def set_colors(colors):
-                    def update_colors():
-                        self.colors = colors
-                    return update_colors
-                t = threading.Timer(time_between_frames * i, set_colors(frames[i]))
-                t.start()
+        icon = self.load_icon(url)
+        if icon.is_animated():
+            # played once by the driver, which clears the leds at the end
+            icons_url = Server().url_for_icon("")
+            if url.startswith(icons_url):
+                self.play(name=url[len(icons_url):])
+            else:
+                self.play(url=url)
         else:
-            colors = []
-            response = requests.get(url)
-            img = BytesIO(response.content)
-            image = Image.open(img)
-            for row in range(13):
-                for col in range(13):
-                    # color = image.getpixel((col, 12 - row))
-                    color = image.getpixel((12 - col, row))[0:3]
-                    colors.append(color)
-            self.colors = colors
-    
+            self.colors = icon.frames[0]
+
     def clear(self):
         self.colors = [[0, 0, 0]] * self.number
 
@@ -427,6 +1090,9 @@ class Pan(DBEntry):
     Set pid_p to a value between 0 and 255 to set the proportional gain.
     Set pid_d to a value between 0 and 255 to set the derivative gain.
     Check temperature to see the temperature.
+    Check voltage, torque, status_error and status_detail to see the rest of the servo telemetry.
+    Set trajectory to a list of [t, angle] waypoints, t in seconds from now, to move smoothly along them.
+    A new trajectory blends with the one in progress, setting angle cancels it.
     """
     prefix = "pan"
     fields = {
@@ -435,6 +1101,7 @@ class Pan(DBEntry):
         "angle": 0,
         "current_angle": 0,
         "angle_ref": None,
+        "trajectory": None,
         "enable": False,
         "enabled": False,
         "pid_p": 150,
@@ -446,6 +1113,10 @@ class Pan(DBEntry):
         "min_playtime": 100,
         "max_playtime": 200,
         "temperature": 0,
+        "voltage": 0.0,
+        "torque": 0,
+        "status_error": 0,
+        "status_detail": 0,
         "angle_bias": 12.0
     }
 
@@ -463,6 +1134,9 @@ class Tilt(DBEntry):
     Set pid_p to a value between 0 and 255 to set the proportional gain.
     Set pid_d to a value between 0 and 255 to set the derivative gain.
     Check temperature to see the temperature.
+    Check voltage, torque, status_error and status_detail to see the rest of the servo telemetry.
+    Set trajectory to a list of [t, angle] waypoints, t in seconds from now, to move smoothly along them.
+    A new trajectory blends with the one in progress, setting angle cancels it.
     """
     prefix = "tilt"
     fields = {
@@ -471,6 +1145,7 @@ class Tilt(DBEntry):
         "angle": 0,
         "current_angle": 0,
         "angle_ref": None,
+        "trajectory": None,
         "enable": False,
         "enabled": False,
         "pid_p": 140,
@@ -482,10 +1157,88 @@ class Tilt(DBEntry):
         "min_playtime": 100,
         "max_playtime": 200,
         "temperature": 0,
+        "voltage": 0.0,
+        "torque": 0,
+        "status_error": 0,
+        "status_detail": 0,
         "angle_bias": 2.3
     }
 
 
+# servo telemetry history, a redis stream written by driver_pan_tilt
+SERVO_TELEMETRY_KEY = "servo_telemetry"
+# number of samples kept in the stream
+SERVO_TELEMETRY_LENGTH = 6000
+# fields of a sample and their types
+SERVO_TELEMETRY_FIELDS = {
+    "time": float,
+    "servo": int,
+    "position": int,
+    "goal": int,
+    "angle": float,
+    "torque": int,
+    "temperature": int,
+    "voltage": float,
+    "status_error": int,
+    "status_detail": int,
+}
+# binary layout of a sample, little endian, in the order of SERVO_TELEMETRY_FIELDS
+SERVO_TELEMETRY_FORMAT = "<dBHHfhBfBB"
+# maximum number of samples returned by a read
+SERVO_TELEMETRY_MAX_COUNT = 1000
+# redis stream ids, <milliseconds>-<sequence>, the sequence is optional
+STREAM_ID = re.compile(r"\d+(-\d+)?")
+
+
+class ServoTelemetry:
+    """
+    Servo telemetry history.
+    driver_pan_tilt adds a sample per servo and telemetry cycle, the stream keeps about the last SERVO_TELEMETRY_LENGTH samples.
+    Use read() to get the samples after a stream id, or the latest samples, as dictionaries.
+    Use pack() to encode samples in the binary layout of SERVO_TELEMETRY_FORMAT.
+    """
+
+    def add(self, samples):
+        """
+        Add samples to the stream, with a single request.
+        """
+        pipeline = connection.pipeline(transaction=False)
+        for sample in samples:
+            fields = {f: sample[f] for f in SERVO_TELEMETRY_FIELDS}
+            pipeline.xadd(SERVO_TELEMETRY_KEY, fields, maxlen=SERVO_TELEMETRY_LENGTH, approximate=True)
+        pipeline.execute()
+
+    def decode(self, entry):
+        entry_id, fields = entry
+        sample = {"id": entry_id.decode()}
+        for f, cast in SERVO_TELEMETRY_FIELDS.items():
+            sample[f] = cast(fields[f.encode()].decode())
+        return sample
+
+    def read(self, since=None, count=100):
+        """
+        Get up to count samples after the stream id since, or the latest count samples if since is None.
+        Each sample has the fields of SERVO_TELEMETRY_FIELDS and its stream id.
+        Raises ValueError if since is not a stream id, or count is not positive.
+        """
+        if since is not None and STREAM_ID.fullmatch(since) is None:
+            raise ValueError(f'invalid stream id: {since}')
+        if count < 1:
+            raise ValueError(f'invalid count: {count}')
+        if since is None:
+            entries = connection.xrevrange(SERVO_TELEMETRY_KEY, count=count)[::-1]
+        else:
+            # exclusive start, the sample with id since was already read
+            entries = connection.xrange(SERVO_TELEMETRY_KEY, min="(" + since, count=count)
+        return [self.decode(e) for e in entries]
+
+    def pack(self, samples):
+        """
+        Encode samples in the binary layout of SERVO_TELEMETRY_FORMAT.
+        """
+        return b"".join(struct.pack(SERVO_TELEMETRY_FORMAT, *[s[f] for f in SERVO_TELEMETRY_FIELDS]) for s in samples)
+
+
 class Onboard(DBEntry):
     """
     Database entry.
@@ -639,7 +1392,7 @@ class Behaviours(DBEntry):
 
 
 if __name__ == '__main__':
-    usage = "usage: python3 middleware.py <list|killall|shutdown|force_shutdown|state|monitor|reset>"
+    usage = "usage: python3 middleware.py <list|status|killall|shutdown|force_shutdown|state|monitor|reset>"
     if len(sys.argv) == 1:
         print(usage)
         sys.exit(1)
@@ -647,6 +1400,9 @@ if __name__ == '__main__':
     if sys.argv[1] == "list":
         node_list = manager.list_nodes()
         print(json.dumps(sorted(node_list), indent=2))
+    elif sys.argv[1] == "status":
+        node_status = {name: manager.status(name) for name in manager.list_nodes()}
+        print(json.dumps(node_status, indent=2, sort_keys=True))
     elif sys.argv[1] == "killall":
         for name in manager.list_nodes():
             manager.shutdown(name)
@@ -664,9 +1420,14 @@ if __name__ == '__main__':
         get_all()
     elif sys.argv[1] == "monitor":
         try:
+            # keys rarely change, only scan for them once per second
+            keys, scanned = None, 0.0
             while True:
+                if keys is None or time.monotonic() - scanned > 1.0:
+                    keys = sorted(set(scan_keys(*[p + "*" for p in sys.argv[2:]])))
+                    scanned = time.monotonic()
                 print("---")
-                get_all(*sys.argv[2:])
+                get_all(keys=keys)
                 time.sleep(0.1)
         except KeyboardInterrupt:
             pass
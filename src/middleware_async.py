@@ -0,0 +1,242 @@
+#! /usr/bin/env python
+
+
+"""
+
+Async middleware.
+
+This module provides an asyncio variant of the middleware client, built on redis.asyncio.
+
+Keys, codecs and node registration are shared with the middleware module, so async and sync clients interoperate.
+
+The AsyncDBEntry class gives async access to the fields of a DBEntry class.
+
+The AsyncNode class signals that a node is running, and lets it await its shutdown.
+
+Changes to keys can be awaited, using the Changes class or wait_for_change().
+
+"""
+
+
+import asyncio
+import redis.asyncio
+
+import middleware as mw
+
+
+def get_connection():
+    """
+    Get an async connection to the redis database.
+    """
+    return redis.asyncio.Redis()
+
+# global connection
+connection = get_connection()
+
+
+async def set_key(key, value):
+    """
+    Set a key in the redis database.
+    """
+    await connection.set(key, mw.codec_for(key).encode(value))
+
+async def get_key(key):
+    """
+    Get a key from the redis database.
+    """
+    return mw.codec_for(key).decode(await connection.get(key))
+
+
+def keyspace_channel(key):
+    """
+    Get the keyspace notification channel of a key.
+    """
+    db = connection.connection_pool.connection_kwargs.get("db", 0)
+    return f'__keyspace@{db}__:{key}'
+
+
+class Changes:
+    """
+    Changes class.
+    Async version of middleware.Changes, backed by its own pub/sub connection.
+    Use await wait() to wait until any of the keys changes.
+    Changes that happen between calls to wait() are not lost.
+    The first call to wait() returns immediately, so the current state can be processed.
+    Use await close() to stop watching the keys.
+    """
+
+    def __init__(self, *keys):
+        self.keys = keys
+        self.pubsub = None
+        self.changed = True
+
+    async def subscribe(self):
+        """
+        Subscribe to the keys, wait() does it on the first call.
+        """
+        if self.pubsub is None:
+            await connection.config_set("notify-keyspace-events", mw.KEYSPACE_EVENTS)
+            self.pubsub = connection.pubsub(ignore_subscribe_messages=True)
+            await self.pubsub.subscribe(*[keyspace_channel(k) for k in self.keys])
+
+    async def wait(self, timeout=None):
+        """
+        Wait for a change, or for the timeout (in seconds) to expire.
+        Returns True if a key changed, False on timeout.
+        """
+        await self.subscribe()
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not self.changed:
+            remaining = 1.0 if deadline is None else deadline - loop.time()
+            if remaining <= 0:
+                return False
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 1.0))
+            if message is not None and message["type"] == "message":
+                self.changed = True
+        self.changed = False
+        return True
+
+    async def close(self):
+        if self.pubsub is not None:
+            await self.pubsub.unsubscribe()
+            await self.pubsub.close()
+            self.pubsub = None
+
+
+async def wait_for_change(keys, timeout=None):
+    """
+    Wait until any of the keys changes, or the timeout (in seconds) expires.
+    Returns True if a key changed, False on timeout.
+    Changes that happen before the call are not seen, use the Changes class in loops.
+    """
+    changes = Changes(*keys)
+    changes.changed = False
+    try:
+        return await changes.wait(timeout)
+    finally:
+        await changes.close()
+
+
+class AsyncDBEntry:
+    """
+    AsyncDBEntry class.
+    Async access to the fields of a DBEntry class, e.g. speakers = AsyncDBEntry(mw.Speakers).
+    Reading a field returns an awaitable: url = await speakers.url
+    Use set() to write a field, and update() to write several fields with a single request.
+    Use snapshot() to read several fields with a single request.
+    Use changes() to wait for changes to fields.
+    """
+
+    def __init__(self, entry_class):
+        self.entry_class = entry_class
+        self.prefix = entry_class.prefix
+        self.fields = entry_class.fields
+
+    def __getattr__(self, field):
+        if field in self.__dict__.get("fields", {}):
+            return self.get(field)
+        raise AttributeError(field)
+
+    def key(self, field):
+        """
+        Get the database key of a field.
+        """
+        return f'{self.prefix}_{field}'
+
+    def default(self, field):
+        """
+        Get the raw default value of a field.
+        """
+        return mw.codec_for(self.key(field)).encode(self.fields[field])
+
+    def decode(self, field, raw):
+        """
+        Decode the raw value of a field.
+        Returns the default value of missing fields, the caller stores it.
+        """
+        return mw.codec_for(self.key(field)).decode(self.default(field) if raw is None else raw)
+
+    async def get(self, field):
+        raw = await connection.get(self.key(field))
+        if raw is None:
+            await connection.set(self.key(field), self.default(field), nx=True)
+        return self.decode(field, raw)
+
+    async def set(self, field, value):
+        await set_key(self.key(field), value)
+
+    async def update(self, **values):
+        """
+        Write several fields with a single MSET.
+        """
+        await connection.mset({self.key(f): mw.codec_for(self.key(f)).encode(v) for f, v in values.items()})
+
+    async def snapshot(self, *fields):
+        """
+        Read several fields with a single MGET.
+        Returns a dictionary with the value of each field, or of all fields if none is given.
+        Missing fields are initialized with their default value, with a single request.
+        """
+        fields = fields or list(self.fields)
+        raws = await connection.mget([self.key(f) for f in fields])
+        missing = [f for f, raw in zip(fields, raws) if raw is None]
+        if len(missing) > 0:
+            pipeline = connection.pipeline(transaction=False)
+            for f in missing:
+                pipeline.set(self.key(f), self.default(f), nx=True)
+            await pipeline.execute()
+        return {f: self.decode(f, raw) for f, raw in zip(fields, raws)}
+
+    def changes(self, *fields):
+        """
+        Get a Changes instance for the given fields.
+        """
+        return Changes(*[self.key(f) for f in fields])
+
+
+class AsyncNode:
+    """
+    AsyncNode class.
+    Initialize this class to signal node is running.
+    Registration, logging and the heartbeat are handled by a middleware.Node.
+    Use await is_shutdown() to check if node should shutdown.
+    Use await wait_shutdown() to block until node should shutdown.
+    Use changes() to wait for changes to keys, that also wakes up on shutdown.
+    Use shutdown() to signal node is shutting down.
+    """
+
+    def __init__(self, name, log_level=mw.Node.INFO):
+        self.node = mw.Node(name, log_level)
+        self.name = name
+
+    def __getattr__(self, name):
+        # loginfo(), logwarn(), logerror(), set_log_level() and tick()
+        return getattr(self.__dict__["node"], name)
+
+    async def is_shutdown(self):
+        """
+        Check if the node should shutdown, from the in-memory shutdown event, so the event loop is not blocked.
+        """
+        self.node.tick()
+        return self.node.shutdown_event.is_set()
+
+    def changes(self, *keys):
+        """
+        Get a Changes instance for the given keys and the node's shutdown flag.
+        """
+        return Changes(self.name + "_is_shutdown", *keys)
+
+    async def wait_shutdown(self):
+        """
+        Wait until the node should shutdown.
+        The node's shutdown event is awaited in an executor thread, at most one heartbeat period at a time.
+        The event is checked on the event loop after each wait, which ticks the heartbeat,
+        so the heartbeat reports the lag of the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while not await self.is_shutdown():
+            await loop.run_in_executor(None, self.node.shutdown_event.wait, mw.HEARTBEAT_PERIOD)
+
+    def shutdown(self):
+        self.node.shutdown()
@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+
+
+"""
+
+Middleware benchmark.
+
+Measures the latency of the middleware operations used by the nodes, and reports percentiles.
+
+Runs against the local redis server, using a separate database so a running robot is not disturbed.
+
+Use --fake to run against fakeredis instead, when no redis server is available.
+Numbers measured with fakeredis do not include the network round trip, only compare them with each other.
+
+Use --output to save the results as json, to compare them between changes.
+
+usage: python3 middleware_benchmark.py [--fake] [--db <db>] [--iterations <n>] [--output <file>]
+
+"""
+
+
+import argparse
+import json
+import platform
+import time
+
+import redis
+
+import middleware as mw
+
+
+# fields read by robot_api to build the /status reply
+STATUS_FIELDS = (
+    (mw.Battery, ("voltage", "percentage")),
+    (mw.Pan, ("current_angle", "min_angle", "max_angle", "enabled", "temperature")),
+    (mw.Tilt, ("current_angle", "min_angle", "max_angle", "enabled", "temperature")),
+    (mw.TouchSensors, ("touch_chest", "touch_head_0", "touch_head_1", "touch_head_2", "touch_head_3")),
+    (mw.Behaviours, ("look_around", "blush")),
+    (mw.Speakers, ("volume",)),
+    (mw.Server, ("http_port",)),
+    (mw.Microphone, ("is_recording",)),
+    (mw.Onboard, ("speech",)),
+)
+
+
+def percentile(samples, p):
+    """
+    Get the p-th percentile of a sorted list of samples.
+    """
+    index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def measure(function, iterations, warmup=10):
+    """
+    Call function repeatedly and return latency statistics, in microseconds.
+    """
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": sum(samples) / len(samples),
+        "p50_us": percentile(samples, 50),
+        "p90_us": percentile(samples, 90),
+        "p99_us": percentile(samples, 99),
+        "max_us": samples[-1],
+        "ops_per_s": len(samples) / (sum(samples) / 1e6),
+    }
+
+
+def run_benchmarks(iterations):
+    """
+    Run all benchmarks, returns a dictionary with the statistics of each one.
+    """
+    pan = mw.Pan()
+    cached_pan = mw.Pan(cache=True)
+    leds = mw.Leds()
+    colors = [[i % 256, (2 * i) % 256, (3 * i) % 256] for i in range(169)]
+    leds.colors = colors
+    status_entries = [(cls(), fields) for cls, fields in STATUS_FIELDS]
+    node = mw.Node("middleware_benchmark")
+    changes = node.changes(pan.key("angle"))
+
+    def getter():
+        pan.angle
+
+    def setter():
+        pan.angle = 10
+
+    def cached_getter():
+        cached_pan.angle
+
+    def status_sequential():
+        for entry, fields in status_entries:
+            for field in fields:
+                getattr(entry, field)
+
+    def status_snapshot():
+        mw.snapshot(*status_entries)
+
+    def leds_round_trip():
+        leds.colors = colors
+        leds.colors
+
+    def node_loop():
+        node.is_shutdown()
+        changes.wait(0)
+
+    benchmarks = {
+        "getter": getter,
+        "setter": setter,
+        "cached_getter": cached_getter,
+        "status_sequential": status_sequential,
+        "status_snapshot": status_snapshot,
+        "leds_colors_round_trip": leds_round_trip,
+        "node_loop": node_loop,
+    }
+    results = {}
+    try:
+        for name, function in benchmarks.items():
+            results[name] = measure(function, iterations)
+    finally:
+        changes.close()
+        node.shutdown()
+    return results
+
+
+def print_results(results):
+    print(f'{"benchmark":<24}{"mean":>10}{"p50":>10}{"p90":>10}{"p99":>10}{"max":>10}{"ops/s":>12}')
+    for name, r in results.items():
+        print(f'{name:<24}{r["mean_us"]:>10.1f}{r["p50_us"]:>10.1f}{r["p90_us"]:>10.1f}'
+              f'{r["p99_us"]:>10.1f}{r["max_us"]:>10.1f}{r["ops_per_s"]:>12.0f}')
+    print("latencies in microseconds")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the middleware.")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of the redis server")
+    parser.add_argument("--db", type=int, default=15, help="redis database to use (default: 15)")
+    parser.add_argument("--iterations", type=int, default=1000, help="iterations per benchmark (default: 1000)")
+    parser.add_argument("--output", help="save the results to a json file")
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        mw.connection = fakeredis.FakeRedis()
+    else:
+        mw.connection = redis.Redis(db=args.db)
+    results = run_benchmarks(args.iterations)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "backend": "fakeredis" if args.fake else "redis",
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+                "time": time.time(),
+                "results": results,
+            }, f, indent=2)
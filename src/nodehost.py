@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+
+
+"""
+
+Node host.
+
+Runs several driver and behaviour nodes inside a single process, one thread per node.
+
+The hosted nodes share the imported libraries and the middleware connection pool, which saves memory and boot time.
+
+Each node keeps its own shutdown flag, so it can still be listed and shutdown with the middleware command line tool.
+The hosted nodes share one process, so force_shutdown of a hosted node only signals it to shutdown.
+SIGTERM and Ctrl+C shutdown all hosted nodes.
+
+The node class of a module is its NODE_CLASS attribute if it defines one,
+otherwise the only class defined in it that has a run method, e.g. DriverGpio in driver_gpio.
+
+usage: python3 -m nodehost <module> [<module> ...]
+
+"""
+
+
+import importlib
+import inspect
+import signal
+import sys
+import threading
+import traceback
+
+import middleware as mw
+
+
+# how long to wait for each node to finish after a shutdown, in seconds
+SHUTDOWN_TIMEOUT = 5.0
+
+
+def find_node_class(module):
+    """
+    Find the node class of a module.
+    Raises RuntimeError if the module does not set NODE_CLASS, and does not define exactly one class with a run method.
+    """
+    cls = getattr(module, "NODE_CLASS", None)
+    if cls is not None:
+        return cls
+    classes = [cls for _, cls in inspect.getmembers(module, inspect.isclass)
+               if cls.__module__ == module.__name__ and callable(getattr(cls, "run", None))]
+    if len(classes) != 1:
+        names = ", ".join(cls.__name__ for cls in classes) or "none"
+        raise RuntimeError(f'{module.__name__} must define exactly one node class, or set NODE_CLASS, found {names}')
+    return classes[0]
+
+
+class NodeHost:
+    """
+    NodeHost class.
+    Imports the node modules, then creates and runs each node in its own thread.
+    Nodes are created inside their thread, so a node that waits for a resource does not delay the others.
+    A node that fails does not stop the others.
+    """
+
+    def __init__(self, module_names):
+        self.classes = {}
+        self.instances = {}
+        self.threads = []
+        for name in module_names:
+            self.classes[name] = find_node_class(importlib.import_module(name))
+
+    def run_node(self, name):
+        try:
+            instance = self.classes[name]()
+            self.instances[name] = instance
+            instance.run()
+        except Exception:
+            print(f'nodehost: {name} failed')
+            traceback.print_exc()
+
+    def shutdown(self):
+        """
+        Signal all hosted nodes to shutdown.
+        """
+        for instance in list(self.instances.values()):
+            # set the event first, so the node stops even if the database is not reachable
+            instance.node.shutdown_event.set()
+            try:
+                mw.set_key(instance.node.name + "_is_shutdown", True)
+            except Exception as e:
+                print(f'nodehost: could not signal {instance.node.name} to shutdown: {e}')
+
+    def stop(self, signum=None, frame=None):
+        """
+        Shutdown all hosted nodes and wait for them to finish, also used as the SIGTERM handler.
+        """
+        self.shutdown()
+        for thread in self.threads:
+            thread.join(SHUTDOWN_TIMEOUT)
+
+    def run(self):
+        """
+        Start all nodes and wait for them to finish.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        for name in self.classes:
+            thread = threading.Thread(target=self.run_node, args=(name,), name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        try:
+            while any(t.is_alive() for t in self.threads):
+                for thread in self.threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        print("usage: python3 -m nodehost <module> [<module> ...]")
+        sys.exit(1)
+    host = NodeHost(sys.argv[1:])
+    host.run()
@@ -5,7 +5,7 @@ import time
 import threading
 import socket
 import json
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from werkzeug.utils import secure_filename
 import logging
 
@@ -38,66 +38,47 @@ class Robot:
     mw_behaviours = mw.Behaviours()
 
     def __init__(self):
-        self.battery = self.mw_battery.voltage
-        self.battery_percentage = self.mw_battery.percentage
-        self.pan = self.mw_pan.current_angle
-        self.tilt = self.mw_tilt.current_angle
-        self.pan_min = self.mw_pan.min_angle
-        self.pan_max = self.mw_pan.max_angle
-        self.tilt_min = self.mw_tilt.min_angle
-        self.tilt_max = self.mw_tilt.max_angle
-        self.pan_torque = self.mw_pan.enabled
-        self.tilt_torque = self.mw_tilt.enabled
-        self.pan_temperature = self.mw_pan.temperature
-        self.tilt_temperature = self.mw_tilt.temperature
-        self.touch_chest = self.mw_touch_sensors.touch_chest
-        self.touch_head_n = self.mw_touch_sensors.touch_head_0
-        self.touch_head_s = self.mw_touch_sensors.touch_head_1
-        self.touch_head_e = self.mw_touch_sensors.touch_head_2
-        self.touch_head_w = self.mw_touch_sensors.touch_head_3
-        self.behaviour_look_around = self.mw_behaviours.look_around
-        self.behaviour_blush = self.mw_behaviours.blush
-        self.video_list = self.mw_server.get_video_list()
-        self.sound_list = self.mw_server.get_sound_list()
-        self.image_list = self.mw_server.get_image_list()
-        self.icon_list = self.mw_server.get_icon_list()
-        self.volume = self.mw_speakers.volume
-        self.multimedia_port = self.mw_server.http_port
-        self.microphone_is_recording = self.mw_microphone.is_recording
-        self.recognized_speech = self.mw_onboard.speech
+        self.update()
 
     def update(self):
-        self.battery = self.mw_battery.voltage
-        self.battery_percentage = self.mw_battery.percentage
-        self.pan = self.mw_pan.current_angle
-        self.tilt = self.mw_tilt.current_angle
-        self.pan_min = self.mw_pan.min_angle
-        self.pan_max = self.mw_pan.max_angle
-        self.tilt_min = self.mw_tilt.min_angle
-        self.tilt_max = self.mw_tilt.max_angle
-        self.pan_torque = self.mw_pan.enabled
-        self.tilt_torque = self.mw_tilt.enabled
-        self.pan_temperature = self.mw_pan.temperature
-        self.tilt_temperature = self.mw_tilt.temperature
-        self.touch_chest = self.mw_touch_sensors.touch_chest
-        self.touch_head_n = self.mw_touch_sensors.touch_head_0
-        self.touch_head_s = self.mw_touch_sensors.touch_head_1
-        self.touch_head_e = self.mw_touch_sensors.touch_head_2
-        self.touch_head_w = self.mw_touch_sensors.touch_head_3
-        self.behaviour_look_around = self.mw_behaviours.look_around
-        self.behaviour_blush = self.mw_behaviours.blush
-        self.video_list = self.mw_server.get_video_list()
-        self.sound_list = self.mw_server.get_sound_list()
-        self.image_list = self.mw_server.get_image_list()
-        self.icon_list = self.mw_server.get_icon_list()
-        self.volume = self.mw_speakers.volume
-        self.multimedia_port = self.mw_server.http_port
-        self.microphone_is_recording = self.mw_microphone.is_recording
-        self.recognized_speech = self.mw_onboard.speech
+        battery, pan, tilt, touch_sensors, behaviours, speakers, server, microphone, onboard = mw.snapshot(
+            (self.mw_battery, ("voltage", "percentage")),
+            (self.mw_pan, ("current_angle", "min_angle", "max_angle", "enabled", "temperature")),
+            (self.mw_tilt, ("current_angle", "min_angle", "max_angle", "enabled", "temperature")),
+            (self.mw_touch_sensors, ("touch_chest", "touch_head_0", "touch_head_1", "touch_head_2", "touch_head_3")),
+            (self.mw_behaviours, ("look_around", "blush")),
+            (self.mw_speakers, ("volume",)),
+            (self.mw_server, ("http_port",)),
+            (self.mw_microphone, ("is_recording",)),
+            (self.mw_onboard, ("speech",)),
+        )
+        self.battery = battery["voltage"]
+        self.battery_percentage = battery["percentage"]
+        self.pan = pan["current_angle"]
+        self.tilt = tilt["current_angle"]
+        self.pan_min = pan["min_angle"]
+        self.pan_max = pan["max_angle"]
+        self.tilt_min = tilt["min_angle"]
+        self.tilt_max = tilt["max_angle"]
+        self.pan_torque = pan["enabled"]
+        self.tilt_torque = tilt["enabled"]
+        self.pan_temperature = pan["temperature"]
+        self.tilt_temperature = tilt["temperature"]
+        self.touch_chest = touch_sensors["touch_chest"]
+        self.touch_head_n = touch_sensors["touch_head_0"]
+        self.touch_head_s = touch_sensors["touch_head_1"]
+        self.touch_head_e = touch_sensors["touch_head_2"]
+        self.touch_head_w = touch_sensors["touch_head_3"]
+        self.behaviour_look_around = behaviours["look_around"]
+        self.behaviour_blush = behaviours["blush"]
         self.video_list = self.mw_server.get_video_list()
         self.sound_list = self.mw_server.get_sound_list()
         self.image_list = self.mw_server.get_image_list()
         self.icon_list = self.mw_server.get_icon_list()
+        self.volume = speakers["volume"]
+        self.multimedia_port = server["http_port"]
+        self.microphone_is_recording = microphone["is_recording"]
+        self.recognized_speech = onboard["speech"]
 
     def enable_look_around(self, control):
         self.mw_behaviours.look_around = bool(control)
@@ -164,6 +145,12 @@ class Robot:
         self.mw_leds.colors = colors
         return True, "OK"
 
+    def set_leds_brightness(self, brightness):
+        if not 0.0 <= brightness <= 1.0:
+            return False, "Brightness must be between 0.0 and 1.0"
+        self.mw_leds.brightness = brightness
+        return True, "OK"
+
     def update_leds_icon(self, name):
         url = self.mw_server.url_for_icon(name)
         self.mw_leds.load_from_url(url)
@@ -211,6 +198,31 @@ def status():
     return jsonify(robot.__dict__)
 
 
+@app.route("/telemetry/servos")
+def telemetry_servos():
+    """
+    Servo telemetry history.
+    Returns up to count samples after the stream id since, or the latest ones, as NDJSON or binary (format=binary).
+    The X-Last-Id header holds the id to pass as since to get the next window.
+    count is capped to SERVO_TELEMETRY_MAX_COUNT, invalid parameters get a 400 reply.
+    """
+    since = request.args.get("since")
+    try:
+        count = min(int(request.args.get("count", 100)), mw.SERVO_TELEMETRY_MAX_COUNT)
+        if request.args.get("format", "ndjson") not in ("ndjson", "binary"):
+            raise ValueError(f'unknown format: {request.args.get("format")}')
+        samples = mw.ServoTelemetry().read(since, count)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    headers = {"X-Last-Id": samples[-1]["id"] if samples else (since or "")}
+    if request.args.get("format") == "binary":
+        headers["X-Sample-Format"] = mw.SERVO_TELEMETRY_FORMAT
+        headers["X-Sample-Fields"] = ",".join(mw.SERVO_TELEMETRY_FIELDS)
+        return Response(mw.ServoTelemetry().pack(samples), mimetype="application/octet-stream", headers=headers)
+    ndjson = "".join(json.dumps(s) + "\n" for s in samples)
+    return Response(ndjson, mimetype="application/x-ndjson", headers=headers)
+
+
 @app.route("/command", methods=["POST"])
 def command():
     try:
@@ -265,6 +277,9 @@ def command():
         elif op == "update_leds_icon":
             name = req["name"]
             success, message = robot.update_leds_icon(name)
+        elif op == "set_leds_brightness":
+            brightness = float(req["brightness"])
+            success, message = robot.set_leds_brightness(brightness)
         elif op == "reboot":
             success, message = robot.reboot()
         elif op == "shutdown":
@@ -314,8 +329,7 @@ if __name__ == '__main__':
     server_thread.start()
     node = mw.Node("robot_api")
     try:
-        while not node.is_shutdown():
-            time.sleep(0.1)
+        node.wait_shutdown()
     except KeyboardInterrupt:
         pass
     except Exception as e:
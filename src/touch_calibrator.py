@@ -21,11 +21,11 @@ The window size and sensitivity can be configured.
 import numpy as np
 
 
-import time
 import middleware as mw
 
 
 WINDOW_SIZE = 100
+RAW_FIELDS = ("chest_raw", "head_0_raw", "head_1_raw", "head_2_raw", "head_3_raw")
 
 
 class TouchCalibrator:
@@ -44,18 +44,23 @@ class TouchCalibrator:
     def run(self):
         try:
             self.node.loginfo("waiting for touch sensors to be ready")
+            ready = self.node.changes(self.touch_sensors.key("ready"))
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                ready.wait(1.0)
                 if self.touch_sensors.ready:
                     break
+            ready.close()
+            # the driver writes all raw values at once, wake up once per sample
+            changes = self.node.changes(self.touch_sensors.key("head_3_raw"))
             self.node.loginfo("calibrating")
             while not self.node.is_shutdown(): 
-                time.sleep(0.1)
-                chest_raw = self.touch_sensors.chest_raw
-                head_0_raw = self.touch_sensors.head_0_raw
-                head_1_raw = self.touch_sensors.head_1_raw
-                head_2_raw = self.touch_sensors.head_2_raw
-                head_3_raw = self.touch_sensors.head_3_raw
+                changes.wait(1.0)
+                raw = self.touch_sensors.snapshot(*RAW_FIELDS)
+                chest_raw = raw["chest_raw"]
+                head_0_raw = raw["head_0_raw"]
+                head_1_raw = raw["head_1_raw"]
+                head_2_raw = raw["head_2_raw"]
+                head_3_raw = raw["head_3_raw"]
                 self.windows["chest"].append(chest_raw)
                 self.windows["head_0"].append(head_0_raw)
                 self.windows["head_1"].append(head_1_raw)
@@ -65,13 +70,14 @@ class TouchCalibrator:
                     self.node.loginfo("calibration complete")
                     break
             while not self.node.is_shutdown():
-                time.sleep(0.1)
+                changes.wait(1.0)
                 # get values
-                chest_raw = self.touch_sensors.chest_raw
-                head_0_raw = self.touch_sensors.head_0_raw
-                head_1_raw = self.touch_sensors.head_1_raw
-                head_2_raw = self.touch_sensors.head_2_raw
-                head_3_raw = self.touch_sensors.head_3_raw
+                raw = self.touch_sensors.snapshot(*RAW_FIELDS)
+                chest_raw = raw["chest_raw"]
+                head_0_raw = raw["head_0_raw"]
+                head_1_raw = raw["head_1_raw"]
+                head_2_raw = raw["head_2_raw"]
+                head_3_raw = raw["head_3_raw"]
                 # add to buffers
                 self.windows["chest"].append(chest_raw)
                 self.windows["head_0"].append(head_0_raw)
@@ -108,11 +114,12 @@ class TouchCalibrator:
                 touch_head_2 = all([v < head_2_lower for v in head_2_last_3])
                 touch_head_3 = all([v < head_3_lower for v in head_3_last_3])
                 # update db
-                self.touch_sensors.touch_chest = touch_chest
-                self.touch_sensors.touch_head_0 = touch_head_0
-                self.touch_sensors.touch_head_1 = touch_head_1
-                self.touch_sensors.touch_head_2 = touch_head_2
-                self.touch_sensors.touch_head_3 = touch_head_3
+                with self.touch_sensors.batch():
+                    self.touch_sensors.touch_chest = touch_chest
+                    self.touch_sensors.touch_head_0 = touch_head_0
+                    self.touch_sensors.touch_head_1 = touch_head_1
+                    self.touch_sensors.touch_head_2 = touch_head_2
+                    self.touch_sensors.touch_head_3 = touch_head_3
         finally:
             self.node.shutdown()
 
@@ -0,0 +1,155 @@
+import pytest
+
+import herkulex as hx
+import herkulex_sim as sim
+
+
+class Capture:
+    """
+    Port that keeps the bytes written to it.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data.extend(data)
+
+
+def encode(servoid, cmd, payload):
+    """
+    Get the bytes of a frame, as sent on the bus.
+    """
+    port = Capture()
+    hx.send_data([7 + len(payload), servoid, cmd] + payload, port)
+    return bytes(port.data)
+
+
+STATUS = encode(3, hx.STAT_ACK, [0x00, 0x01])
+READ = encode(4, hx.RAM_READ_ACK, [hx.CALIBRATED_POSITION_RAM, 2, 0x00, 0x40, 0x00, 0x01])
+
+
+class LossyBus(sim.SimulatedBus):
+    """
+    Simulated bus that drops the first response of each servo and command.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.answered = set()
+
+    def respond(self, servoid, cmd, data):
+        if (servoid, cmd) not in self.answered:
+            self.answered.add((servoid, cmd))
+            self.stats["dropped"] += 1
+            return
+        super().respond(servoid, cmd, data)
+
+
+@pytest.fixture
+def lossy_bus():
+    with LossyBus([sim.SimulatedServo(3), sim.SimulatedServo(4)]) as sim_bus:
+        bus = hx.HerkulexBus(sim_bus.port_name)
+        yield bus
+        bus.close()
+
+
+def test_scan_retries_expected_servos(lossy_bus):
+    assert lossy_bus.scan_servos(ids=range(6), expected=[3, 4]) == [(3, 0x06), (4, 0x06)]
+
+
+def test_servo_retries_model_read(lossy_bus):
+    assert hx.servo(3, lossy_bus).servomodel == 0x06
+
+
+def test_decoder_decodes_frames():
+    decoder = hx.FrameDecoder()
+    frames = decoder.feed(STATUS + READ)
+    assert [(f.servoid, f.cmd) for f in frames] == [(3, hx.STAT_ACK), (4, hx.RAM_READ_ACK)]
+    assert frames[1].values == bytearray([0x00, 0x40])
+    assert frames[1].status_detail == 0x01
+    assert decoder.garbled == 0
+
+
+def test_decoder_rejects_bad_checksum():
+    decoder = hx.FrameDecoder()
+    corrupted = bytearray(STATUS)
+    corrupted[5] ^= 0x02
+    assert decoder.feed(bytes(corrupted)) == []
+    assert decoder.garbled > 0
+    frames = decoder.feed(READ)
+    assert [f.servoid for f in frames] == [4]
+
+
+def test_decoder_resyncs_after_garbage():
+    decoder = hx.FrameDecoder()
+    frames = decoder.feed(b"\x00\x12\xff\x03" + STATUS + b"\xff")
+    assert [f.servoid for f in frames] == [3]
+    assert decoder.garbled > 0
+    # the trailing 0xFF may start a header
+    frames = decoder.feed(READ[1:])
+    assert [f.servoid for f in frames] == [4]
+
+
+def test_decoder_joins_split_frames():
+    decoder = hx.FrameDecoder()
+    frames = []
+    for i in range(len(READ)):
+        assert decoder.needed() >= 1
+        frames += decoder.feed(READ[i:i + 1])
+        assert len(frames) == (1 if i == len(READ) - 1 else 0)
+    assert frames[0].values == bytearray([0x00, 0x40])
+    assert decoder.garbled == 0
+
+
+class RecordingBus:
+    """
+    Bus that records the commands of the requests it executes.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def execute(self, data):
+        self.commands.append((data[2], data[1]))
+        if data[1] == 0xEE:
+            raise hx.HerkulexTimeout("no response from servo %d" % data[1])
+        return None
+
+
+def test_scheduler_orders_requests():
+    bus = RecordingBus()
+    scheduler = hx.BusScheduler(bus)
+    requests = [
+        scheduler.submit([0x09, 1, hx.RAM_READ_REQ, 0, 1]),
+        scheduler.submit([0x0A, 2, hx.RAM_WRITE_REQ, 0, 1, 0]),
+        scheduler.submit([0x0C, 3, hx.I_JOG_REQ, 0, 0, 0, 3, 1]),
+        scheduler.submit([0x07, 4, hx.STAT_REQ]),
+        scheduler.submit([0x0A, 5, hx.RAM_WRITE_REQ, 0, 1, 0]),
+        scheduler.submit([0x0C, 6, hx.S_JOG_REQ, 1, 0, 0, 0, 6]),
+    ]
+    scheduler.start()
+    for request in requests:
+        request.wait(1.0)
+    scheduler.stop()
+    # motions, then writes, then reads, in the order they were queued
+    assert [servoid for _, servoid in bus.commands] == [3, 6, 2, 5, 1, 4]
+
+
+def test_scheduler_reports_errors():
+    scheduler = hx.BusScheduler(RecordingBus())
+    scheduler.start()
+    with pytest.raises(hx.HerkulexTimeout):
+        scheduler.submit([0x07, 0xEE, hx.STAT_REQ]).wait(1.0)
+    scheduler.stop()
+
+
+def test_scheduler_on_simulated_bus():
+    with sim.SimulatedBus([sim.SimulatedServo(3), sim.SimulatedServo(4)]) as sim_bus:
+        bus = hx.HerkulexBus(sim_bus.port_name)
+        bus.start_scheduler()
+        try:
+            assert [model for _, model in bus.scan_servos(ids=[3, 4])] == [0x06, 0x06]
+            assert hx.servo(4, bus).servomodel == 0x06
+        finally:
+            bus.close()
@@ -0,0 +1,54 @@
+import pytest
+
+import led_effects
+
+
+INVALID_VALUES = [0, -1.0, "fast", None, float("nan")]
+
+POSITIVE_PARAMS = [
+    ("breathe", "period"),
+    ("rainbow", "period"),
+    ("spinner", "period"),
+    ("spinner", "tail"),
+    ("meter", "release"),
+    ("meter", "peak_fall"),
+    ("text", "speed"),
+]
+
+
+@pytest.mark.parametrize("effect_type", sorted(led_effects.EFFECTS))
+def test_render_defaults(effect_type):
+    effect = led_effects.create({"type": effect_type})
+    assert effect.render(0.5).shape == (13, 13, 3)
+
+
+def test_create_unknown_type():
+    with pytest.raises(ValueError):
+        led_effects.create({"type": "sparkle"})
+
+
+@pytest.mark.parametrize("effect_type, name", POSITIVE_PARAMS)
+@pytest.mark.parametrize("value", INVALID_VALUES)
+def test_create_invalid_param(effect_type, name, value):
+    with pytest.raises(ValueError):
+        led_effects.create({"type": effect_type, name: value})
+
+
+@pytest.mark.parametrize("effect_type, name", POSITIVE_PARAMS)
+@pytest.mark.parametrize("value", INVALID_VALUES)
+def test_update_invalid_param_keeps_effect(effect_type, name, value):
+    effect = led_effects.create({"type": effect_type})
+    default = getattr(effect, name)
+    with pytest.raises(ValueError):
+        effect.update({name: value, "color": [1, 2, 3]})
+    assert getattr(effect, name) == default
+    assert effect.render(1.0).shape == (13, 13, 3)
+
+
+def test_update_keeps_state():
+    meter = led_effects.create({"type": "meter", "level": 1.0})
+    meter.render(0.0)
+    meter.update({"type": "meter", "level": 0.0, "release": 2.0})
+    meter.render(0.25)
+    # the bars fall at the release rate instead of dropping at once
+    assert meter.shown[0] == pytest.approx(0.5)
@@ -0,0 +1,120 @@
+import time
+
+import fakeredis
+import pytest
+import redis
+
+import middleware as mw
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class FlakyRedis(fakeredis.FakeRedis):
+    """
+    Fake redis whose notifications fail while down is set, and that records the config it receives.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.down = False
+        self.configs = []
+
+    def config_set(self, name, value, *args, **kwargs):
+        self.configs.append((name, value))
+        return True
+
+    def pubsub(self, **kwargs):
+        pubsub = super().pubsub(**kwargs)
+        get_message = pubsub.get_message
+
+        def flaky_get_message(*args, **kwargs):
+            if self.down:
+                raise redis.ConnectionError("connection lost")
+            return get_message(*args, **kwargs)
+        pubsub.get_message = flaky_get_message
+        return pubsub
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(mw, "connection", FlakyRedis(server=server))
+    monkeypatch.setattr(mw, "watcher", mw.Watcher())
+    monkeypatch.setattr(mw, "RECONNECT_PERIOD", 0.5)
+    return server
+
+
+def test_cache_is_invalidated(server):
+    pan = mw.Pan(cache=True)
+    pan.angle = 5
+    assert pan.angle == 5
+    mw.connection.set(pan.key("angle"), "7")
+    assert wait_until(lambda: pan.angle == 7)
+    pan.close()
+
+
+def test_reconnect_drops_cache_and_enables_notifications(server):
+    pan = mw.Pan(cache=True)
+    pan.angle = 5
+    # let the notification of the write invalidate the cache, before caching the value
+    time.sleep(0.2)
+    assert pan.angle == 5
+    assert mw.connection.configs == [("notify-keyspace-events", mw.KEYSPACE_EVENTS)]
+    mw.connection.down = True
+    # let the watcher thread see the lost connection, the write is not notified
+    time.sleep(0.2)
+    mw.connection.set(pan.key("angle"), "7")
+    mw.connection.down = False
+    assert pan.angle == 5
+    assert wait_until(lambda: pan.angle == 7)
+    assert mw.connection.configs[-1] == ("notify-keyspace-events", mw.KEYSPACE_EVENTS)
+    assert len(mw.connection.configs) == 2
+    # later writes are notified again
+    mw.connection.set(pan.key("angle"), "9")
+    assert wait_until(lambda: pan.angle == 9)
+    pan.close()
+
+
+def test_close_removes_callbacks(server):
+    pan = mw.Pan(cache=True)
+    values = []
+    pan.watch("angle", values.append)
+    assert pan.key("angle") in mw.watcher.callbacks
+    pan.close()
+    assert not any(key.startswith("pan_") for key in mw.watcher.callbacks)
+    pan.angle = 3
+    assert pan.angle == 3
+
+
+def test_changes_records_changed_keys(server):
+    pan = mw.Pan()
+    changes = pan.changes("angle", "enable")
+    assert changes.wait(0)
+    assert changes.pop() == {pan.key("angle"), pan.key("enable")}
+    pan.angle = 5
+    assert changes.wait(5.0)
+    assert changes.pop() == {pan.key("angle")}
+    assert changes.pop() == set()
+    changes.close()
+
+
+def test_servo_telemetry_read_after_id(server):
+    telemetry = mw.ServoTelemetry()
+    sample = {f: 1 for f in mw.SERVO_TELEMETRY_FIELDS}
+    for ms in (1700000000000, 1700000000001):
+        mw.connection.xadd(mw.SERVO_TELEMETRY_KEY, sample, id=f'{ms}-0')
+    assert [s["id"] for s in telemetry.read()] == ["1700000000000-0", "1700000000001-0"]
+    assert [s["id"] for s in telemetry.read(since="1700000000000-0")] == ["1700000000001-0"]
+    assert [s["id"] for s in telemetry.read(since="1700000000000")] == ["1700000000001-0"]
+    assert [s["id"] for s in telemetry.read(since="1700000000000", count=1)] == ["1700000000001-0"]
+    with pytest.raises(ValueError):
+        telemetry.read(since="latest")
+    with pytest.raises(ValueError):
+        telemetry.read(count=0)
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+import middleware as mw
+import middleware_async as amw
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(mw, "connection", fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(mw, "watcher", mw.Watcher())
+    monkeypatch.setattr(amw, "connection", fakeredis.aioredis.FakeRedis(server=server))
+    return server
+
+
+def test_snapshot_stores_defaults(server):
+    speakers = amw.AsyncDBEntry(mw.Speakers)
+    mw.connection.set(speakers.key("volume"), "40")
+    values = asyncio.run(speakers.snapshot("volume", "url"))
+    assert values == {"volume": 40, "url": None}
+    assert mw.connection.get(speakers.key("volume")) == b"40"
+    assert mw.connection.get(speakers.key("url")) == b"null"
+
+
+def test_wait_shutdown(server):
+    async def main():
+        node = amw.AsyncNode("async_node")
+        assert not await node.is_shutdown()
+        threading.Timer(0.2, mw.set_key, ("async_node_is_shutdown", True)).start()
+        start = time.monotonic()
+        await node.wait_shutdown()
+        assert time.monotonic() - start < mw.HEARTBEAT_PERIOD
+        assert await node.is_shutdown()
+        node.shutdown()
+    asyncio.run(main())
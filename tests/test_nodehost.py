@@ -0,0 +1,60 @@
+import os
+import types
+
+import fakeredis
+import pytest
+
+import middleware as mw
+import nodehost
+
+
+def make_module(**members):
+    module = types.ModuleType("hosted")
+    for name, value in members.items():
+        if isinstance(value, type):
+            value.__module__ = module.__name__
+        setattr(module, name, value)
+    return module
+
+
+class Node:
+    def run(self):
+        pass
+
+
+class Helper:
+    pass
+
+
+class OtherNode:
+    def run(self):
+        pass
+
+
+def test_find_node_class():
+    assert nodehost.find_node_class(make_module(Node=Node, Helper=Helper)) is Node
+
+
+def test_find_node_class_requires_one_class():
+    with pytest.raises(RuntimeError):
+        nodehost.find_node_class(make_module(Helper=Helper))
+    with pytest.raises(RuntimeError):
+        nodehost.find_node_class(make_module(Node=Node, OtherNode=OtherNode))
+
+
+def test_find_node_class_explicit():
+    module = make_module(Node=Node, OtherNode=OtherNode, NODE_CLASS=OtherNode)
+    assert nodehost.find_node_class(module) is OtherNode
+
+
+def test_force_shutdown_of_hosted_node_does_not_kill(monkeypatch):
+    monkeypatch.setattr(mw, "connection", fakeredis.FakeRedis())
+    monkeypatch.setattr(os, "kill", lambda pid, sig: pytest.fail("hosted node was killed"))
+    for name in ("driver_gpio", "driver_power"):
+        mw.connection.sadd(mw.NODES_KEY, name)
+        mw.set_key("node_" + name, os.getpid())
+    manager = mw.NodeManager()
+    assert manager.shares_process("driver_gpio") == ["driver_power"]
+    manager.force_shutdown("driver_gpio")
+    assert mw.get_key("driver_gpio_is_shutdown") is True
+    assert sorted(manager.list_nodes()) == ["driver_gpio", "driver_power"]